@@ -0,0 +1,316 @@
+# almacen_clima.py - almacenamiento Parquet particionado por ciudad/año
+
+import calendar
+import glob
+import json
+import os
+import sys
+import uuid
+import zlib
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+RUTA_ALMACEN = os.path.join('data', 'clima')
+RUTA_CSV = os.path.join('data', 'datos_climaticos_chile_10_anios.csv')
+NOMBRE_PARTICION = 'datos.parquet'
+NOMBRE_MANIFIESTO = 'manifiesto.json'
+NOMBRE_SNAPSHOT = 'snapshot.arrow'
+
+COLUMNAS_METRICAS = ['temp_max_c', 'temp_min_c', 'precipitacion_mm', 'viento_max_kmh']
+COLUMNAS = ['ciudad', 'fecha'] + COLUMNAS_METRICAS
+
+# Esquema de cada archivo; ciudad y anio viven en la ruta (particionado hive)
+ESQUEMA = pa.schema([('fecha', pa.date32())] + [(c, pa.float32()) for c in COLUMNAS_METRICAS])
+PARTICIONADO = ds.partitioning(
+    pa.schema([('ciudad', pa.string()), ('anio', pa.int16())]), flavor='hive'
+)
+
+
+def ruta_particion(ciudad, anio, raiz=RUTA_ALMACEN):
+    return os.path.join(raiz, f"ciudad={quote(ciudad, safe='')}", f"anio={int(anio)}", NOMBRE_PARTICION)
+
+
+def existe_almacen(raiz=RUTA_ALMACEN):
+    return os.path.isdir(raiz) and any(n.startswith('ciudad=') for n in os.listdir(raiz))
+
+
+def normalizar(df):
+    # Tipos canonicos: ciudad categorica, fecha sin hora, metricas float32
+    df = df[COLUMNAS].copy()
+    df['ciudad'] = df['ciudad'].astype('category')
+    df['fecha'] = pd.to_datetime(df['fecha']).dt.normalize()
+    df[COLUMNAS_METRICAS] = df[COLUMNAS_METRICAS].astype('float32')
+    return df
+
+
+def _reemplazo_atomico(ruta, escribir):
+    # Escribir a un temporal en el mismo directorio y reemplazar: los lectores
+    # ven el archivo anterior o el nuevo, nunca uno a medio escribir
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    try:
+        escribir(tmp)
+        os.replace(tmp, ruta)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _escribir_atomico(tabla, ruta):
+    _reemplazo_atomico(ruta, lambda tmp: pq.write_table(tabla, tmp))
+
+
+def _a_tabla(df):
+    return pa.Table.from_pandas(
+        df[['fecha'] + COLUMNAS_METRICAS].reset_index(drop=True), schema=ESQUEMA, preserve_index=False
+    )
+
+
+# --------------------
+# MANIFIESTO DE COBERTURA
+# --------------------
+# manifiesto.json resume lo que hay en el almacen sin leer los Parquet:
+# {"version": n, "ciudades": {ciudad: {"filas", "checksum",
+#   "particiones": {"2015": {"filas", "crc32", "meses": {"01": dias_con_datos}}}}}}
+
+def ruta_manifiesto(raiz=RUTA_ALMACEN):
+    return os.path.join(raiz, NOMBRE_MANIFIESTO)
+
+
+def leer_manifiesto(raiz=RUTA_ALMACEN):
+    ruta = ruta_manifiesto(raiz)
+    if not os.path.exists(ruta):
+        return {'version': 0, 'ciudades': {}}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(manifiesto, raiz):
+    def escribir(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False, sort_keys=True)
+
+    _reemplazo_atomico(ruta_manifiesto(raiz), escribir)
+
+
+def _crc32_archivo(ruta):
+    crc = 0
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(bloque, crc)
+    return crc
+
+
+def _resumen_particion(grupo, ruta):
+    # Un dia cuenta como cubierto si trae al menos una metrica
+    con_datos = grupo.loc[grupo[COLUMNAS_METRICAS].notna().any(axis=1), 'fecha']
+    dias = con_datos.dt.month.value_counts().sort_index()
+    return {
+        'filas': int(len(grupo)),
+        'crc32': _crc32_archivo(ruta),
+        'meses': {f"{int(mes):02d}": int(n) for mes, n in dias.items()},
+    }
+
+
+def _actualizar_ciudad(manifiesto, ciudad, anio, resumen):
+    entrada = manifiesto['ciudades'].setdefault(ciudad, {'filas': 0, 'checksum': 0, 'particiones': {}})
+    entrada['particiones'][str(anio)] = resumen
+    particiones = entrada['particiones']
+    entrada['filas'] = sum(p['filas'] for p in particiones.values())
+    crc = 0
+    for clave in sorted(particiones):
+        crc = zlib.crc32(f"{clave}:{particiones[clave]['crc32']};".encode(), crc)
+    entrada['checksum'] = crc
+
+
+def reconstruir_manifiesto(raiz=RUTA_ALMACEN):
+    # Recorre las particiones existentes; solo para almacenes sin manifiesto
+    manifiesto = {'version': 1, 'ciudades': {}}
+    if existe_almacen(raiz):
+        df = leer_datos(raiz=raiz)
+        for (ciudad, anio), grupo in df.groupby(['ciudad', df['fecha'].dt.year], observed=True):
+            resumen = _resumen_particion(grupo, ruta_particion(ciudad, anio, raiz))
+            _actualizar_ciudad(manifiesto, ciudad, int(anio), resumen)
+    _guardar_manifiesto(manifiesto, raiz)
+    return manifiesto
+
+
+def meses_incompletos(manifiesto, ciudad, meses_objetivo):
+    # Meses (anio, mes) sin datos o con menos dias que calendar.monthrange
+    particiones = manifiesto['ciudades'].get(ciudad, {}).get('particiones', {})
+    faltantes = []
+    for anio, mes in meses_objetivo:
+        dias = particiones.get(str(anio), {}).get('meses', {}).get(f"{mes:02d}", 0)
+        if dias < calendar.monthrange(anio, mes)[1]:
+            faltantes.append((anio, mes))
+    return faltantes
+
+
+def particiones_cambiadas(anterior, nuevo):
+    # {ciudad: primer año con una particion nueva, borrada o con otro crc32}
+    cambios = {}
+    ciudades_anteriores = anterior.get('ciudades', {})
+    ciudades_nuevas = nuevo.get('ciudades', {})
+    for ciudad in set(ciudades_anteriores) | set(ciudades_nuevas):
+        antes = ciudades_anteriores.get(ciudad, {}).get('particiones', {})
+        despues = ciudades_nuevas.get(ciudad, {}).get('particiones', {})
+        anios = [int(a) for a in set(antes) | set(despues)
+                 if antes.get(a, {}).get('crc32') != despues.get(a, {}).get('crc32')]
+        if anios:
+            cambios[ciudad] = min(anios)
+    return cambios
+
+
+def escribir_datos_particiones(df, raiz=RUTA_ALMACEN):
+    # Combina df con las particiones existentes (gana el dato nuevo por fecha)
+    # y reescribe cada particion ciudad/año tocada, sin tocar el manifiesto.
+    # Devuelve [(ciudad, año, resumen)] para registrar_particiones.
+    if df.empty:
+        return []
+    df = normalizar(df.dropna(subset=['fecha']))
+    resumenes = []
+    for (ciudad, anio), grupo in df.groupby(['ciudad', df['fecha'].dt.year], observed=True):
+        ruta = ruta_particion(ciudad, anio, raiz)
+        if os.path.exists(ruta):
+            existente = pq.read_table(ruta).to_pandas(date_as_object=False)
+            existente['fecha'] = existente['fecha'].astype('datetime64[ns]')
+            grupo = pd.concat([existente, grupo.drop(columns='ciudad')], ignore_index=True)
+        grupo = grupo.drop_duplicates(subset='fecha', keep='last').sort_values('fecha')
+        _escribir_atomico(_a_tabla(grupo), ruta)
+        resumenes.append((ciudad, int(anio), _resumen_particion(grupo, ruta)))
+    return resumenes
+
+
+def registrar_particiones(resumenes, raiz=RUTA_ALMACEN):
+    # Un solo proceso debe escribir el manifiesto; con varios procesos de
+    # descarga, estos escriben particiones y el proceso principal las registra
+    manifiesto = cargar_manifiesto(raiz)
+    for ciudad, anio, resumen in resumenes:
+        _actualizar_ciudad(manifiesto, ciudad, anio, resumen)
+    manifiesto['version'] = manifiesto.get('version', 0) + 1
+    _guardar_manifiesto(manifiesto, raiz)
+    return manifiesto
+
+
+def escribir_particiones(df, raiz=RUTA_ALMACEN):
+    # El manifiesto se guarda al final: si el proceso se corta antes, los
+    # meses nuevos simplemente se vuelven a pedir y la combinacion por fecha
+    # los deja igual.
+    resumenes = escribir_datos_particiones(df, raiz)
+    if not resumenes:
+        return []
+    registrar_particiones(resumenes, raiz)
+    return [(ciudad, anio) for ciudad, anio, _ in resumenes]
+
+
+def cargar_manifiesto(raiz=RUTA_ALMACEN):
+    # Almacenes creados antes del manifiesto se indexan una sola vez
+    if existe_almacen(raiz) and not os.path.exists(ruta_manifiesto(raiz)):
+        return reconstruir_manifiesto(raiz)
+    return leer_manifiesto(raiz)
+
+
+def _filtro(ciudades, desde, hasta):
+    expr = None
+
+    def y(e):
+        return e if expr is None else expr & e
+
+    if ciudades:
+        expr = y(ds.field('ciudad').isin(list(ciudades)))
+    if desde is not None:
+        desde = pd.Timestamp(desde)
+        expr = y(ds.field('anio') >= desde.year)
+        expr = y(ds.field('fecha') >= pa.scalar(desde.date(), pa.date32()))
+    if hasta is not None:
+        hasta = pd.Timestamp(hasta)
+        expr = y(ds.field('anio') <= hasta.year)
+        expr = y(ds.field('fecha') <= pa.scalar(hasta.date(), pa.date32()))
+    return expr
+
+
+def _archivos_particion(ciudades, raiz):
+    # Solo archivos de particion confirmados (sin temporales ni el manifiesto)
+    patrones = [f"ciudad={quote(c, safe='')}" for c in ciudades] if ciudades else ['ciudad=*']
+    archivos = []
+    for patron in patrones:
+        archivos.extend(glob.glob(os.path.join(glob.escape(raiz), patron, 'anio=*', NOMBRE_PARTICION)))
+    return sorted(archivos)
+
+
+def leer_datos(ciudades=None, desde=None, hasta=None, columnas=None, raiz=RUTA_ALMACEN):
+    # Lectura con proyeccion de columnas; el filtro por ciudad/año descarta
+    # particiones completas y el de fecha se empuja al lector Parquet
+    columnas = list(columnas) if columnas else COLUMNAS
+    archivos = _archivos_particion(ciudades, raiz)
+    if not archivos:
+        return normalizar(pd.DataFrame(columns=COLUMNAS))[columnas]
+    dataset = ds.dataset(archivos, format='parquet', partitioning=PARTICIONADO, partition_base_dir=raiz)
+    tabla = dataset.to_table(columns=columnas, filter=_filtro(ciudades, desde, hasta))
+    df = tabla.to_pandas(date_as_object=False)
+    if 'ciudad' in df.columns:
+        df['ciudad'] = df['ciudad'].astype('category')
+    if 'fecha' in df.columns:
+        df['fecha'] = df['fecha'].astype('datetime64[ns]')
+    orden = [c for c in ('ciudad', 'fecha') if c in df.columns]
+    if orden:
+        df = df.sort_values(orden, ignore_index=True)
+    return df
+
+
+def cargar_datos(raiz=RUTA_ALMACEN, ruta_csv=RUTA_CSV):
+    # Preferir el almacen; el CSV historico queda como respaldo mientras no se migre
+    if existe_almacen(raiz):
+        return leer_datos(raiz=raiz)
+    return normalizar(pd.read_csv(ruta_csv))
+
+
+# --------------------
+# SNAPSHOT BINARIO
+# --------------------
+# Copia Arrow IPC sin comprimir del dataframe ya preparado por el dashboard.
+# Se abre con memory map: las columnas numericas sin nulos no se copian y los
+# workers que leen el mismo archivo comparten las paginas del sistema.
+
+def ruta_snapshot(raiz=RUTA_ALMACEN):
+    return os.path.join(raiz, NOMBRE_SNAPSHOT)
+
+
+def escribir_snapshot(df, clave, raiz=RUTA_ALMACEN):
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(tabla.schema.metadata or {})
+    metadata[b'clave_snapshot'] = str(clave).encode()
+    tabla = tabla.replace_schema_metadata(metadata)
+    _reemplazo_atomico(
+        ruta_snapshot(raiz), lambda tmp: feather.write_feather(tabla, tmp, compression='uncompressed')
+    )
+
+
+def leer_snapshot(clave, raiz=RUTA_ALMACEN):
+    # None si no hay snapshot o si se armo para otra clave (otra version de datos)
+    ruta = ruta_snapshot(raiz)
+    if not os.path.exists(ruta):
+        return None
+    tabla = pa.ipc.open_file(pa.memory_map(ruta)).read_all()
+    if (tabla.schema.metadata or {}).get(b'clave_snapshot') != str(clave).encode():
+        return None
+    return tabla.to_pandas(split_blocks=True)
+
+
+def migrar_csv(ruta_csv=RUTA_CSV, raiz=RUTA_ALMACEN):
+    df = pd.read_csv(ruta_csv)
+    df = df.dropna(subset=['ciudad', 'fecha'])
+    return escribir_particiones(df, raiz)
+
+
+if __name__ == '__main__':
+    # Migracion unica: python almacen_clima.py [ruta_csv] [raiz_almacen]
+    ruta_csv = sys.argv[1] if len(sys.argv) > 1 else RUTA_CSV
+    raiz = sys.argv[2] if len(sys.argv) > 2 else RUTA_ALMACEN
+    particiones = migrar_csv(ruta_csv, raiz)
+    print(f"Migradas {len(particiones)} particiones desde '{ruta_csv}' a '{raiz}'")
@@ -2,49 +2,35 @@
 
 import dash
 from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate, MissingCallbackContextException
 import dash_bootstrap_components as dbc
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io.json
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from collections import namedtuple
 import calendar
+import json
+import os
+import threading
+import time
+
+import almacen_clima
+import ubicaciones
+from cubo_agregados import construir_cubo, seleccionar, medias_por, estadisticos
+from cache_resultados import CacheLRU
+from indice_clima import IndiceClima
+import metricas
+import muestreo
+from medias_moviles import inicios_ventana, media_movil_agrupada
 
 # --------------------
 # 1) CARGA DE DATOS
 # --------------------
-DF_PATH = 'data/datos_climaticos_chile_10_anios.csv'
-
-try:
-    df = pd.read_csv(DF_PATH)
-except Exception as e:
-    raise FileNotFoundError(f"No se pudo leer {DF_PATH}: {e}")
-
-# Normalizar fechas y columnas
-df['fecha'] = pd.to_datetime(df['fecha'])
-df['mes'] = df['fecha'].dt.month
-df['año'] = df['fecha'].dt.year
-
-# Coordenadas
-coordenadas = {
-    "Arica": (-18.47, -70.31), "Iquique": (-20.21, -70.15),
-    "Antofagasta": (-23.65, -70.40), "Copiapo": (-27.37, -70.33),
-    "La Serena": (-29.90, -71.25), "Valparaiso": (-33.05, -71.62),
-    "Santiago": (-33.46, -70.65), "Rancagua": (-34.17, -70.74),
-    "Talca": (-35.43, -71.65), "Chillan": (-36.61, -72.10),
-    "Concepcion": (-36.83, -73.05), "Temuco": (-38.74, -72.59),
-    "Valdivia": (-39.81, -73.25), "Puerto Montt": (-41.47, -72.94),
-    "Coyhaique": (-45.57, -72.07), "Punta Arenas": (-53.16, -70.92)
-}
-
-df_coords = pd.DataFrame(coordenadas.items(), columns=['ciudad', 'coords'])
-df_coords[['lat', 'lon']] = pd.DataFrame(df_coords['coords'].tolist(), index=df_coords.index)
-if 'ciudad' not in df.columns:
-    raise KeyError('El dataframe debe contener la columna "ciudad"')
-df = pd.merge(df, df_coords[['ciudad', 'lat', 'lon']], on='ciudad', how='left')
-
-# Controles
-ciudades_disponibles = sorted(df['ciudad'].unique())
+# Coordenadas desde el registro de ubicaciones (el mismo que usa el extractor)
+df_coords = ubicaciones.cargar_ubicaciones().rename(columns={'nombre': 'ciudad'})
 
 # --- ¡CAMBIO AQUÍ! Se añade la nueva métrica ---
 metricas_disponibles = {
@@ -54,7 +40,10 @@ metricas_disponibles = {
     'viento_max_kmh': 'Velocidad del Viento (km/h)'
 }
 
-available_years = sorted(df['año'].unique())
+# Medias móviles por ciudad precalculadas para cada métrica y ventana (en días
+# de calendario): activar la opción en el dashboard solo lee columnas ya calculadas
+VENTANAS_MEDIA_MOVIL = {'ma7': 7, 'ma30': 30, 'ma365': 365}
+
 month_options = [
     {'label': 'Enero', 'value': 1}, {'label': 'Febrero', 'value': 2},
     {'label': 'Marzo', 'value': 3}, {'label': 'Abril', 'value': 4},
@@ -64,6 +53,221 @@ month_options = [
     {'label': 'Noviembre', 'value': 11}, {'label': 'Diciembre', 'value': 12}
 ]
 
+# Resultados filtrados por worker; el dcc.Store solo guarda la clave del filtro
+cache_filtrados = CacheLRU(int(os.environ.get('CLIMA_CACHE_MB', 64)) * 1024 * 1024)
+
+# Figuras ya serializadas por worker, por panel y sus entradas reales; el
+# tamaño de cada entrada es el largo del JSON
+cache_figuras = CacheLRU(int(os.environ.get('CLIMA_CACHE_FIGURAS_MB', 64)) * 1024 * 1024, tamano=len)
+
+# Reducción de la serie de tiempo: ~2 puntos por píxel de ancho en cada traza
+ANCHO_SERIE_PX = int(os.environ.get('CLIMA_ANCHO_SERIE_PX', 1000))
+PUNTOS_SERIE = int(os.environ.get('CLIMA_PUNTOS_SERIE', 2 * ANCHO_SERIE_PX))
+ALGORITMO_MUESTREO = os.environ.get('CLIMA_MUESTREO', 'minmax')
+if ALGORITMO_MUESTREO not in muestreo.ALGORITMOS:
+    raise ValueError(f"CLIMA_MUESTREO debe ser uno de {muestreo.ALGORITMOS}")
+
+# Carga: 'fondo' levanta el servidor de inmediato y carga en un hilo;
+# 'inmediata' carga al importar (usar con gunicorn --preload para que los
+# workers hereden los datos del proceso maestro)
+MODO_CARGA = os.environ.get('CLIMA_MODO_CARGA', 'fondo')
+USAR_SNAPSHOT = os.environ.get('CLIMA_SNAPSHOT', '1') != '0'
+# Cambia si cambian las columnas derivadas o sus tipos, para no reutilizar snapshots viejos
+FIRMA_SNAPSHOT = '|'.join(['v3', ','.join(metricas_disponibles), ','.join(VENTANAS_MEDIA_MOVIL)])
+
+DatosDashboard = namedtuple('DatosDashboard', [
+    'df', 'indice', 'cubo', 'ciudades_disponibles', 'available_years', 'fecha_max', 'version', 'manifiesto', 'cargado_en'
+])
+
+# Estado compartido por los callbacks; None hasta que termina la carga. Una
+# recarga arma un DatosDashboard nuevo y lo reemplaza con una sola asignación
+datos = None
+error_carga = None
+bloqueo_datos = threading.Lock()
+
+# Cada cuántos segundos se revisa el manifiesto en busca de datos nuevos (0 = nunca)
+INTERVALO_RECARGA = float(os.environ.get('CLIMA_INTERVALO_RECARGA', 30))
+
+
+def preparar_dataframe(df):
+    if 'ciudad' not in df.columns:
+        raise KeyError('El dataframe debe contener la columna "ciudad"')
+
+    # Formato compacto: ciudad categórica (categorías en orden alfabético, el
+    # mismo orden que tenían los textos) y partes de la fecha en enteros
+    # chicos; las métricas ya vienen en float32 desde almacen_clima. Las
+    # coordenadas quedan en df_coords y solo el mapa las une, sobre una fila
+    # por ciudad.
+    ciudad = df['ciudad'].astype('category').cat.remove_unused_categories()
+    df['ciudad'] = ciudad.cat.reorder_categories(sorted(ciudad.cat.categories))
+    df['mes'] = df['fecha'].dt.month.astype('int8')
+    df['año'] = df['fecha'].dt.year.astype('int16')
+
+    # Índice por (ciudad, fecha) para filtrar por rango sin recorrer todo el dataframe
+    indice = IndiceClima(df)
+    df = indice.df
+
+    # El borde izquierdo de cada ventana depende solo de las fechas: se calcula
+    # una vez por ventana y sirve para todas las métricas
+    izquierdas = {opcion: inicios_ventana(df['fecha'].to_numpy(), indice.tramos.values(), dias)
+                  for opcion, dias in VENTANAS_MEDIA_MOVIL.items()}
+    for m in metricas_disponibles:
+        for opcion in VENTANAS_MEDIA_MOVIL:
+            df[f'{m}_{opcion}'] = media_movil_agrupada(df[m].to_numpy(), izquierdas[opcion]).astype('float32')
+    return indice
+
+
+def construir_datos():
+    # El manifiesto se lee antes que los datos: como se guarda después de las
+    # particiones, los datos leídos nunca son más viejos que su versión
+    manifiesto = almacen_clima.leer_manifiesto() if almacen_clima.existe_almacen() else None
+    version = manifiesto['version'] if manifiesto else None
+    clave_snapshot = f'{version}|{FIRMA_SNAPSHOT}'
+
+    df = None
+    if USAR_SNAPSHOT and version is not None:
+        try:
+            df = almacen_clima.leer_snapshot(clave_snapshot)
+        except Exception as e:
+            print(f"Snapshot ilegible, se reconstruye: {e}")
+    if df is not None:
+        indice = IndiceClima(df, ordenado=True)
+    else:
+        try:
+            df = almacen_clima.cargar_datos()
+        except Exception as e:
+            raise FileNotFoundError(f"No se pudo leer {almacen_clima.RUTA_ALMACEN} ni {almacen_clima.RUTA_CSV}: {e}")
+        indice = preparar_dataframe(df)
+        if USAR_SNAPSHOT and version is not None:
+            try:
+                almacen_clima.escribir_snapshot(indice.df, clave_snapshot)
+            except OSError as e:
+                print(f"No se pudo escribir el snapshot: {e}")
+    return armar_datos(indice, version, manifiesto)
+
+
+def armar_datos(indice, version=None, manifiesto=None):
+    df = indice.df
+
+    # Agregados mensuales para KPIs, mapa y anomalías (se arman una vez al cargar)
+    cubo = construir_cubo(df, list(metricas_disponibles))
+
+    return DatosDashboard(
+        df=df,
+        indice=indice,
+        cubo=cubo,
+        ciudades_disponibles=sorted(df['ciudad'].unique()),
+        available_years=[int(a) for a in sorted(df['año'].unique())],
+        fecha_max=df['fecha'].max(),
+        version=version,
+        manifiesto=manifiesto,
+        cargado_en=datetime.now(),
+    )
+
+
+def cargar_datos_dashboard():
+    global datos, error_carga
+    inicio = time.perf_counter()
+    try:
+        datos = construir_datos()
+    except Exception as e:
+        error_carga = e
+        print(f"Error al cargar los datos: {e}")
+        return
+    print(f"Datos cargados en {time.perf_counter() - inicio:.2f}s ({len(datos.df)} filas)")
+
+
+def filtro_afectado(clave, cambios):
+    # Un cambio en el año A toca las medias móviles hasta un año después, así
+    # que se descarta todo filtro de esa ciudad que termine en A o más tarde
+    ciudades, _, hasta = clave
+    for ciudad in ciudades or cambios:
+        if ciudad in cambios and (not hasta or int(hasta[:4]) >= cambios[ciudad]):
+            return True
+    return False
+
+
+def recargar_datos():
+    # Arma los datos nuevos fuera del camino de las peticiones y los cambia de golpe
+    global datos
+    anteriores = datos
+    inicio = time.perf_counter()
+    nuevos = construir_datos()
+    cambios = almacen_clima.particiones_cambiadas(anteriores.manifiesto or {}, nuevos.manifiesto or {})
+    with bloqueo_datos:
+        datos = nuevos
+        invalidados = cache_filtrados.invalidar(lambda clave: filtro_afectado(clave, cambios))
+        # Los filtros que sobreviven son vistas del df anterior y lo mantendrían
+        # entero en memoria: se vuelven a pedir al índice nuevo (mismas filas)
+        cache_filtrados.reemplazar(lambda clave, _: filtrar_dataframe(nuevos, *clave))
+        # Las anomalías dependen de toda la historia: las figuras se descartan completas
+        cache_figuras.limpiar()
+    print(f"Datos recargados (versión {anteriores.version} -> {nuevos.version}) en {time.perf_counter() - inicio:.2f}s; "
+          f"{invalidados} filtros invalidados")
+
+
+def vigilar_datos():
+    ruta = almacen_clima.ruta_manifiesto()
+    ultima_mtime = None
+    while True:
+        time.sleep(INTERVALO_RECARGA)
+        actuales = datos
+        if actuales is None or actuales.version is None:
+            continue
+        try:
+            mtime = os.stat(ruta).st_mtime_ns
+            if mtime == ultima_mtime:
+                continue
+            ultima_mtime = mtime
+            if almacen_clima.leer_manifiesto()['version'] != actuales.version:
+                recargar_datos()
+        except Exception as e:
+            # Se sigue sirviendo la versión cargada y se reintenta en la próxima vuelta
+            ultima_mtime = None
+            print(f"Error al recargar los datos: {e}")
+
+
+pid_vigia = None
+
+def iniciar_vigia():
+    # Un hilo por proceso: con gunicorn --preload se arranca en cada worker
+    # (en la primera petición) y no en el maestro
+    global pid_vigia
+    if INTERVALO_RECARGA <= 0 or pid_vigia == os.getpid():
+        return
+    with bloqueo_datos:
+        if pid_vigia == os.getpid():
+            return
+        pid_vigia = os.getpid()
+    threading.Thread(target=vigilar_datos, name='vigia-datos', daemon=True).start()
+
+
+def iniciar_carga_en_segundo_plano():
+    threading.Thread(target=cargar_datos_dashboard, name='carga-datos', daemon=True).start()
+
+
+def obtener_datos():
+    # Se lee una sola vez por callback para no mezclar versiones de datos
+    if datos is None:
+        raise PreventUpdate
+    return datos
+
+
+def es_vigente(candidatos):
+    return candidatos is datos
+
+
+if MODO_CARGA == 'inmediata':
+    cargar_datos_dashboard()
+    if error_carga is not None:
+        raise error_carga
+else:
+    iniciar_carga_en_segundo_plano()
+    if hasattr(os, 'register_at_fork'):
+        # Un fork (gunicorn --preload) no hereda el hilo: si la carga no
+        # había terminado, cada worker la reinicia
+        os.register_at_fork(after_in_child=lambda: datos is None and error_carga is None and iniciar_carga_en_segundo_plano())
+
 # --------------------
 # 2) APP (estilos y tema)
 # --------------------
@@ -81,64 +285,79 @@ app.index_string = app.index_string.replace(
 # 3) LAYOUT
 # --------------------
 
-sidebar = html.Div([
-    html.Div([
-        html.H2('Dashboard Clima de Chile (2015-2025)', className='brand text-light'),
-        html.P('Análisis interactivo de datos', className='muted small'),
-    ], className='mb-4'),
+def texto_version(datos):
+    actualizado = datos.cargado_en if datos else datetime.now()
+    texto = f'Última actualización: {actualizado.strftime("%Y-%m-%d %H:%M")}'
+    if datos is not None and datos.version is not None:
+        texto += f' (datos v{datos.version})'
+    return [texto]
+
+def construir_sidebar(datos):
+    # Sin datos (validación de callbacks) los controles quedan vacíos
+    ciudades_disponibles = datos.ciudades_disponibles if datos else []
+    available_years = datos.available_years if datos else [None, None]
+    mes_max = datos.fecha_max.month if datos else None
 
-    dbc.Card(
-        dbc.CardBody([
-            html.H6("Instrucciones", className="card-title text-white"),
-            html.P("Usa los filtros y presiona 'Actualizar' para explorar los datos.", className="small muted")
-        ]),
-        color="dark",
-        className="mb-4"
-    ),
-
-    html.Label('Ciudades', className='text-light small'),
-    dcc.Dropdown(id='selector-ciudad', options=[{'label': c, 'value': c} for c in ciudades_disponibles], value=['Santiago', 'Valparaiso'], multi=True, placeholder='Selecciona ciudades...', className='dropdown-fix'),
-    html.Br(),
-
-    html.Label('Métrica', className='text-light small'),
-    dbc.RadioItems(id='selector-metrica', options=[{'label': v, 'value': k} for k, v in metricas_disponibles.items()], value='temp_max_c', inline=False),
-    html.Br(),
-
-    html.Label('Rango de Fechas', className='text-light small mb-2'),
-    dbc.Card(
-        dbc.CardBody([
-            html.Div("Desde:", className="small muted"),
-            dbc.Row([
-                dbc.Col(dcc.Dropdown(id='selector-año-inicio', options=[{'label': y, 'value': y} for y in available_years], value=available_years[-2], placeholder="Año", className='dropdown-fix'), width=6),
-                dbc.Col(dcc.Dropdown(id='selector-mes-inicio', options=month_options, value=df['fecha'].max().month, placeholder="Mes", className='dropdown-fix'), width=6),
-            ], className="mb-2"),
-            html.Div("Hasta:", className="small muted"),
-            dbc.Row([
-                dbc.Col(dcc.Dropdown(id='selector-año-fin', options=[{'label': y, 'value': y} for y in available_years], value=available_years[-1], placeholder="Año", className='dropdown-fix'), width=6),
-                dbc.Col(dcc.Dropdown(id='selector-mes-fin', options=month_options, value=df['fecha'].max().month, placeholder="Mes", className='dropdown-fix'), width=6),
+    return html.Div([
+        html.Div([
+            html.H2('Dashboard Clima de Chile (2015-2025)', className='brand text-light'),
+            html.P('Análisis interactivo de datos', className='muted small'),
+        ], className='mb-4'),
+
+        dbc.Card(
+            dbc.CardBody([
+                html.H6("Instrucciones", className="card-title text-white"),
+                html.P("Usa los filtros y presiona 'Actualizar' para explorar los datos.", className="small muted")
+            ]),
+            color="dark",
+            className="mb-4"
+        ),
+
+        html.Label('Ciudades', className='text-light small'),
+        dcc.Dropdown(id='selector-ciudad', options=[{'label': c, 'value': c} for c in ciudades_disponibles], value=['Santiago', 'Valparaiso'], multi=True, placeholder='Selecciona ciudades...', className='dropdown-fix'),
+        html.Br(),
+
+        html.Label('Métrica', className='text-light small'),
+        dbc.RadioItems(id='selector-metrica', options=[{'label': v, 'value': k} for k, v in metricas_disponibles.items()], value='temp_max_c', inline=False),
+        html.Br(),
+
+        html.Label('Rango de Fechas', className='text-light small mb-2'),
+        dbc.Card(
+            dbc.CardBody([
+                html.Div("Desde:", className="small muted"),
+                dbc.Row([
+                    dbc.Col(dcc.Dropdown(id='selector-año-inicio', options=[{'label': y, 'value': y} for y in available_years], value=available_years[-2], placeholder="Año", className='dropdown-fix'), width=6),
+                    dbc.Col(dcc.Dropdown(id='selector-mes-inicio', options=month_options, value=mes_max, placeholder="Mes", className='dropdown-fix'), width=6),
+                ], className="mb-2"),
+                html.Div("Hasta:", className="small muted"),
+                dbc.Row([
+                    dbc.Col(dcc.Dropdown(id='selector-año-fin', options=[{'label': y, 'value': y} for y in available_years], value=available_years[-1], placeholder="Año", className='dropdown-fix'), width=6),
+                    dbc.Col(dcc.Dropdown(id='selector-mes-fin', options=month_options, value=mes_max, placeholder="Mes", className='dropdown-fix'), width=6),
+                ]),
             ]),
-        ]),
-        color="dark",
-        className="mb-3"
-    ),
-
-    dbc.Button('Actualizar', id='btn-actualizar', color='primary', className='mb-3 w-100', n_clicks=0),
-
-    html.Hr(),
-    html.P('Opciones', className='text-light small'),
-    dbc.Checklist(options=[{'label': 'Mostrar medias móviles (7d)', 'value': 'ma7'}, {'label': 'Suavizar líneas', 'value': 'smooth'}], value=['ma7'], id='opciones-graficos', inline=False),
-    html.Div(id='version-info', className='muted small mt-4', children=[f'Última actualización: {datetime.now().strftime("%Y-%m-%d")}']),
-    
-    html.Div([
+            color="dark",
+            className="mb-3"
+        ),
+
+        dbc.Button('Actualizar', id='btn-actualizar', color='primary', className='mb-3 w-100', n_clicks=0),
+
         html.Hr(),
-        html.P("Realizado por: Ricardo Urdaneta", className="small text-white"),
+        html.P('Opciones', className='text-light small'),
+        dbc.Checklist(options=[{'label': f'Mostrar medias móviles ({v}d)', 'value': k} for k, v in VENTANAS_MEDIA_MOVIL.items()] + [{'label': 'Suavizar líneas', 'value': 'smooth'}], value=['ma7'], id='opciones-graficos', inline=False),
+        html.Div(id='version-info', className='muted small mt-4', children=texto_version(datos)),
+        dcc.Store(id='version-datos', data=datos.version if datos else None),
+        dcc.Interval(id='intervalo-version', interval=max(INTERVALO_RECARGA, 1) * 1000, disabled=INTERVALO_RECARGA <= 0),
+
         html.Div([
-            html.A(dbc.Button(html.I(className="fab fa-github"), color="light", outline=True, size="sm"), href="https://github.com/Ricardouchub", target="_blank", className="me-2"),
-            html.A(dbc.Button(html.I(className="fab fa-linkedin"), color="light", outline=True, size="sm"), href="https://www.linkedin.com/in/ricardourdanetacastro/", target="_blank"),
-        ])
-    ], className="text-center mt-4")
+            html.Hr(),
+            html.P("Realizado por: Ricardo Urdaneta", className="small text-white"),
+            html.Div([
+                html.A(dbc.Button(html.I(className="fab fa-github"), color="light", outline=True, size="sm"), href="https://github.com/Ricardouchub", target="_blank", className="me-2"),
+                html.A(dbc.Button(html.I(className="fab fa-linkedin"), color="light", outline=True, size="sm"), href="https://www.linkedin.com/in/ricardourdanetacastro/", target="_blank"),
+            ])
+        ], className="text-center mt-4")
 
-], className='sidebar')
+    ], className='sidebar')
 
 content = html.Div([
     html.Div(id='fila-kpis', className='mb-4'),
@@ -153,26 +372,206 @@ content = html.Div([
     dcc.Store(id='df-filtrado'),
 ])
 
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(sidebar, width=12, lg=2),
-        dbc.Col(content, width=12, lg=10, style={'padding': '2rem'})
-    ], className="g-0")
-], fluid=True, className="p-0")
+def layout_dashboard(datos):
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(construir_sidebar(datos), width=12, lg=2),
+            dbc.Col(content, width=12, lg=10, style={'padding': '2rem'})
+        ], className="g-0")
+    ], fluid=True, className="p-0")
+
+def layout_carga():
+    mensaje = 'Cargando datos, la página se actualizará sola...'
+    if error_carga is not None:
+        mensaje = f'No se pudieron cargar los datos: {error_carga}'
+    return dbc.Container([
+        html.Div([
+            html.H2('Dashboard Clima de Chile', className='brand text-light'),
+            html.P(mensaje, className='muted'),
+            dbc.Spinner(color='primary'),
+        ], className='text-center', style={'padding': '4rem'}),
+        dcc.Interval(id='espera-datos', interval=1000),
+    ], fluid=True)
+
+def construir_layout():
+    # Se evalúa en cada carga de página: mientras no hay datos se muestra la espera
+    actuales = datos
+    return layout_dashboard(actuales) if actuales is not None else layout_carga()
+
+app.layout = construir_layout
+app.validation_layout = html.Div([layout_dashboard(None), layout_carga()])
+
+# La página de espera consulta /ready y se recarga cuando los datos están listos
+app.clientside_callback(
+    """function(n) {
+        fetch('/ready').then(function(r) { if (r.ok) { window.location.reload(); } });
+        return window.dash_clientside.no_update;
+    }""",
+    Output('espera-datos', 'disabled'),
+    Input('espera-datos', 'n_intervals')
+)
+
+@server.before_request
+def arrancar_vigia():
+    iniciar_vigia()
+
+@server.route('/health')
+def health():
+    return {'estado': 'vivo'}
+
+@server.route('/ready')
+def ready():
+    actuales = datos
+    if actuales is not None:
+        return {'estado': 'listo', 'filas': len(actuales.df), 'version': actuales.version}, 200
+    if error_carga is not None:
+        return {'estado': 'error', 'detalle': str(error_carga)}, 500
+    return {'estado': 'cargando'}, 503
+
+# Métricas en /metrics solo con CLIMA_METRICAS=1; los contadores del cache se leen al exponer
+metricas.registrar_valor('clima_cache_aciertos_total', 'Aciertos del cache de filtros', lambda: cache_filtrados.aciertos, 'counter')
+metricas.registrar_valor('clima_cache_fallos_total', 'Fallos del cache de filtros', lambda: cache_filtrados.fallos, 'counter')
+metricas.registrar_valor('clima_cache_bytes', 'Bytes ocupados por el cache de filtros', lambda: cache_filtrados.bytes_usados)
+metricas.registrar_valor('clima_cache_entradas', 'Entradas en el cache de filtros', lambda: len(cache_filtrados))
+metricas.registrar_valor('clima_cache_figuras_aciertos_total', 'Aciertos del cache de figuras', lambda: cache_figuras.aciertos, 'counter')
+metricas.registrar_valor('clima_cache_figuras_fallos_total', 'Fallos del cache de figuras', lambda: cache_figuras.fallos, 'counter')
+metricas.registrar_valor('clima_cache_figuras_bytes', 'Bytes ocupados por el cache de figuras', lambda: cache_figuras.bytes_usados)
+metricas.registrar_valor('clima_datos_filas', 'Filas cargadas en el dashboard', lambda: len(datos.df) if datos is not None else None)
+metricas.instrumentar_servidor(server)
 
 
 # --------------------
 # 4) HELPERS
 # --------------------
-def filtrar_dataframe(ciudades, start_date, end_date):
-    df_local = df.copy()
-    if ciudades:
-        df_local = df_local[df_local['ciudad'].isin(ciudades)]
-    if start_date:
-        df_local = df_local[df_local['fecha'] >= pd.to_datetime(start_date)]
-    if end_date:
-        df_local = df_local[df_local['fecha'] <= pd.to_datetime(end_date)]
-    return df_local
+def filtrar_dataframe(datos, ciudades, start_date, end_date):
+    # Devuelve tramos del dataframe cargado: no modificar el resultado
+    return datos.indice.consultar(ciudades, start_date or None, end_date or None)
+
+def clave_filtro(filtro):
+    return (tuple(filtro['ciudades']), filtro['desde'], filtro['hasta'])
+
+def obtener_filtrado(datos, filtro):
+    clave = clave_filtro(filtro)
+    df_filtrado = cache_filtrados.obtener(clave)
+    if df_filtrado is None:
+        with metricas.tramo('filtro'):
+            df_filtrado = filtrar_dataframe(datos, filtro['ciudades'], filtro['desde'], filtro['hasta'])
+        with bloqueo_datos:
+            # Si hubo una recarga mientras se filtraba, el resultado es de la versión anterior
+            if es_vigente(datos):
+                cache_filtrados.guardar(clave, df_filtrado)
+    return df_filtrado
+
+def rango_zoom(relayout):
+    # Rango del eje x después de un zoom; None si se volvió a la vista completa
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout:
+        return relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    if 'xaxis.range' in relayout:
+        return tuple(relayout['xaxis.range'])
+    return None
+
+def reducir_serie(sub, columna, rango=None):
+    # sub: una ciudad ordenada por fecha. Con zoom se recorta al rango visible
+    # (más un punto a cada lado) y el presupuesto completo se gasta ahí.
+    if rango is not None:
+        fechas = sub['fecha'].to_numpy()
+        a = max(np.searchsorted(fechas, np.datetime64(pd.Timestamp(rango[0])), 'left') - 1, 0)
+        b = min(np.searchsorted(fechas, np.datetime64(pd.Timestamp(rango[1])), 'right') + 1, len(sub))
+        sub = sub.iloc[a:b]
+    posiciones = muestreo.reducir(sub['fecha'].to_numpy(), sub[columna].to_numpy(), PUNTOS_SERIE, ALGORITMO_MUESTREO)
+    return sub.iloc[posiciones]
+
+def figura_serie(df_filtrado, metrica, opciones, rango=None):
+    partes = [reducir_serie(sub[['ciudad', 'fecha', metrica]], metrica, rango)
+              for _, sub in df_filtrado.groupby('ciudad', observed=True, sort=False)]
+    df_serie = pd.concat(partes)
+    # WebGL no admite line_shape='spline'; con suavizado se fuerza SVG
+    render_mode = 'svg' if 'smooth' in opciones else 'auto'
+    fig_series = px.line(df_serie, x='fecha', y=metrica, color='ciudad', template='plotly_dark', markers=False, render_mode=render_mode)
+    fig_series.update_layout(margin=dict(t=30,l=0,r=0,b=0), legend_title_text='')
+    # Las medias vienen precalculadas sobre toda la historia de cada ciudad
+    for opcion, ventana in VENTANAS_MEDIA_MOVIL.items():
+        if opcion not in opciones:
+            continue
+        columna = f'{metrica}_{opcion}'
+        for ciudad, sub in df_filtrado.groupby('ciudad', observed=True, sort=False):
+            if len(sub) > 7:
+                sub = reducir_serie(sub[['fecha', columna]], columna, rango)
+                fig_series.add_traces(go.Scatter(x=sub['fecha'], y=sub[columna], mode='lines', name=f'{ciudad} (MA{ventana})', line=dict(width=1, dash='dash')))
+    if 'smooth' in opciones:
+        fig_series.update_traces(line_shape='spline')
+    if rango is not None:
+        fig_series.update_xaxes(range=list(rango))
+    return fig_series
+
+def celdas_filtro(datos, df_filtrado):
+    # Celdas del cubo que cubren el filtro (el filtro siempre abarca meses completos)
+    ciudades_sel = df_filtrado['ciudad'].unique()
+    desde = (df_filtrado['fecha'].min().year, df_filtrado['fecha'].min().month)
+    hasta = (df_filtrado['fecha'].max().year, df_filtrado['fecha'].max().month)
+    return ciudades_sel, seleccionar(datos.cubo, ciudades_sel, desde, hasta)
+
+def kpi_card(titulo, valor, sub, icon='fas fa-thermometer-half'):
+    return dbc.Col(dbc.Card(dbc.CardBody([
+        html.Div([html.I(className=icon + ' fa-2x'), html.Span(titulo, className='ms-3 muted small')], className='d-flex align-items-center'),
+        html.H3(f"{valor:.2f}"),
+        html.P(sub, className='muted small')
+    ]), className='kpi-card p-3'), md=4)
+
+def panel_kpis(df_filtrado, celdas, metrica):
+    resumen = estadisticos(celdas, metrica)
+    prom = resumen['media']
+    ult = df_filtrado.sort_values('fecha').iloc[-1][metrica]
+    primero = df_filtrado.sort_values('fecha').iloc[0][metrica]
+    cambio_pct = (ult - primero) / (abs(primero) + 1e-9) * 100
+    return dbc.Row([kpi_card('Promedio', prom, 'Promedio en el periodo'), kpi_card('Último registro', ult, f'Cambio: {cambio_pct:.1f}%'), kpi_card('Rango', resumen['max'] - resumen['min'], 'Max - Min')])
+
+def figura_mapa(celdas, metrica):
+    df_mapa = medias_por(celdas, metrica, 'ciudad').rename('valor_agregado').reset_index()
+    df_mapa['ciudad'] = df_mapa['ciudad'].astype(str)
+    df_mapa = pd.merge(df_mapa, df_coords[['ciudad', 'lat', 'lon']], on='ciudad', how='left')
+    fig_map = px.scatter_mapbox(df_mapa, lat='lat', lon='lon', size='valor_agregado', color='valor_agregado', hover_name='ciudad',
+                                labels={'valor_agregado': metricas_disponibles[metrica]}, zoom=3.5, center={'lat':-38.4161,'lon':-72.3437}, template='plotly_dark')
+    fig_map.update_layout(mapbox_style='carto-darkmatter', margin=dict(t=30,l=0,r=0,b=0))
+    return fig_map
+
+def figura_anomalias(datos, ciudades_sel, celdas, metrica):
+    with metricas.tramo('anomalias_agregacion'):
+        prom_hist_mensual = medias_por(seleccionar(datos.cubo, ciudades_sel), metrica, 'mes')
+        prom_filtrado_mensual = medias_por(celdas, metrica, 'mes')
+        df_anom = (prom_filtrado_mensual - prom_hist_mensual).reset_index().rename(columns={metrica: 'anomalia'})
+    if df_anom.empty:
+        return go.Figure().update_layout(template='plotly_dark', title_text="No hay datos de anomalía para el período.")
+    df_anom['mes'] = df_anom['mes'].astype(int)
+    df_anom['color'] = np.where(df_anom['anomalia'] > 0, 'tomato', 'lightblue')
+    fig_anom = px.bar(df_anom, x='mes', y='anomalia', template='plotly_dark', labels={'mes':'Mes','anomalia':f'Diferencia ({metricas_disponibles[metrica]})'})
+    fig_anom.update_traces(marker_color=df_anom['color'])
+    fig_anom.update_layout(xaxis=dict(tickmode='linear'))
+    return fig_anom
+
+def figura_distribucion(df_filtrado, metrica):
+    fig_box = px.box(df_filtrado, x='ciudad', y=metrica, points='outliers', template='plotly_dark')
+    fig_box.update_layout(showlegend=False)
+    return fig_box
+
+def figura_en_cache(datos, clave, construir):
+    # clave: (panel, filtro, métrica, ...) sin la versión, que se agrega acá.
+    # Se guarda el JSON que Dash enviaría; en un acierto solo se decodifica.
+    clave = (datos.version,) + clave
+    serializada = cache_figuras.obtener(clave)
+    if serializada is None:
+        serializada = plotly.io.json.to_json_plotly(construir())
+        cache_figuras.guardar(clave, serializada)
+    return json.loads(serializada)
+
+def id_disparador():
+    try:
+        return dash.ctx.triggered_id
+    except (MissingCallbackContextException, LookupError):
+        # Llamada directa fuera de una petición (p. ej. benchmarks o hilos de prueba)
+        return None
 
 # --------------------
 # 5) CALLBACKS
@@ -186,78 +585,138 @@ def filtrar_dataframe(ciudades, start_date, end_date):
      State('selector-año-fin', 'value'),
      State('selector-mes-fin', 'value')]
 )
+@metricas.instrumentar('actualizar_store')
 def actualizar_store(n_clicks, ciudades, año_inicio, mes_inicio, año_fin, mes_fin):
+    datos = obtener_datos()
     if not all([año_inicio, mes_inicio, año_fin, mes_fin]):
-        return pd.DataFrame().to_json(date_format='iso', orient='records')
+        return None
 
     start_date = f"{año_inicio}-{mes_inicio:02d}-01"
     _, last_day = calendar.monthrange(año_fin, mes_fin)
     end_date = f"{año_fin}-{mes_fin:02d}-{last_day}"
-    
-    df_local = filtrar_dataframe(ciudades, start_date, end_date)
-    return df_local.to_json(date_format='iso', orient='records')
 
+    # Solo la clave viaja al navegador; el resultado queda en cache_filtrados
+    filtro = {'ciudades': sorted(ciudades or []), 'desde': start_date, 'hasta': end_date}
+    obtener_filtrado(datos, filtro)
+    return filtro
+
+# Un callback por panel, cada uno con sus entradas reales: cambiar la métrica
+# no rehace lo que no depende de ella y las opciones solo tocan la serie
 @app.callback(
-    [Output('fila-kpis', 'children'), Output('grafico-serie-tiempo', 'figure'), Output('mapa-interactivo', 'figure'), Output('grafico-anomalias', 'figure'), Output('grafico-distribucion', 'figure')],
-    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value'), Input('opciones-graficos', 'value')]
+    Output('fila-kpis', 'children'),
+    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value')]
 )
-def renderizar_dashboard(df_json, metrica, opciones):
-    if not df_json:
-        return [], go.Figure(), go.Figure(), go.Figure(), go.Figure()
-
-    df_filtrado = pd.read_json(df_json, convert_dates=['fecha'])
+@metricas.instrumentar('renderizar_kpis')
+def renderizar_kpis(filtro, metrica):
+    if not filtro:
+        return []
+    datos = obtener_datos()
+    df_filtrado = obtener_filtrado(datos, filtro)
     if df_filtrado.empty:
-        return [], go.Figure(), go.Figure(), go.Figure(), go.Figure()
-
-    # KPIs
-    prom = df_filtrado[metrica].mean()
-    ult = df_filtrado.sort_values('fecha').iloc[-1][metrica]
-    primero = df_filtrado.sort_values('fecha').iloc[0][metrica]
-    cambio_pct = (ult - primero) / (abs(primero) + 1e-9) * 100
-
-    def kpi_card(titulo, valor, sub, icon='fas fa-thermometer-half'):
-        return dbc.Col(dbc.Card(dbc.CardBody([
-            html.Div([html.I(className=icon + ' fa-2x'), html.Span(titulo, className='ms-3 muted small')], className='d-flex align-items-center'),
-            html.H3(f"{valor:.2f}"),
-            html.P(sub, className='muted small')
-        ]), className='kpi-card p-3'), md=4)
+        return []
+    with metricas.tramo('kpis'):
+        _, celdas = celdas_filtro(datos, df_filtrado)
+        return panel_kpis(df_filtrado, celdas, metrica)
 
-    kpis = dbc.Row([kpi_card('Promedio', prom, 'Promedio en el periodo'), kpi_card('Último registro', ult, f'Cambio: {cambio_pct:.1f}%'), kpi_card('Rango', df_filtrado[metrica].max() - df_filtrado[metrica].min(), 'Max - Min')])
-
-    # Gráficos
-    fig_series = px.line(df_filtrado, x='fecha', y=metrica, color='ciudad', template='plotly_dark', markers=False)
-    fig_series.update_layout(margin=dict(t=30,l=0,r=0,b=0), legend_title_text='')
-    if 'ma7' in opciones:
-        for ciudad in df_filtrado['ciudad'].unique():
-            sub = df_filtrado[df_filtrado['ciudad'] == ciudad].sort_values('fecha')
-            if len(sub) > 7:
-                sub['ma7'] = sub[metrica].rolling(7, min_periods=1).mean()
-                fig_series.add_traces(go.Scatter(x=sub['fecha'], y=sub['ma7'], mode='lines', name=f'{ciudad} (MA7)', line=dict(width=1, dash='dash')))
-    if 'smooth' in opciones:
-        fig_series.update_traces(line_shape='spline')
-
-    df_mapa = df_filtrado.groupby('ciudad', as_index=False).agg(lat=('lat','first'), lon=('lon','first'), valor_agregado=(metrica,'mean'))
-    fig_map = px.scatter_mapbox(df_mapa, lat='lat', lon='lon', size='valor_agregado', color='valor_agregado', hover_name='ciudad',
-                                labels={'valor_agregado': metricas_disponibles[metrica]}, zoom=3.5, center={'lat':-38.4161,'lon':-72.3437}, template='plotly_dark')
-    fig_map.update_layout(mapbox_style='carto-darkmatter', margin=dict(t=30,l=0,r=0,b=0))
-
-    df_hist = df[df['ciudad'].isin(df_filtrado['ciudad'].unique())]
-    prom_hist_mensual = df_hist.groupby('mes')[metrica].mean()
-    prom_filtrado_mensual = df_filtrado.groupby('mes')[metrica].mean()
-    df_anom = (prom_filtrado_mensual - prom_hist_mensual).reset_index().rename(columns={metrica: 'anomalia'})
-    if not df_anom.empty:
-        df_anom['mes'] = df_anom['mes'].astype(int)
-        df_anom['color'] = np.where(df_anom['anomalia'] > 0, 'tomato', 'lightblue')
-        fig_anom = px.bar(df_anom, x='mes', y='anomalia', template='plotly_dark', labels={'mes':'Mes','anomalia':f'Diferencia ({metricas_disponibles[metrica]})'})
-        fig_anom.update_traces(marker_color=df_anom['color'])
-        fig_anom.update_layout(xaxis=dict(tickmode='linear'))
-    else:
-        fig_anom = go.Figure().update_layout(template='plotly_dark', title_text="No hay datos de anomalía para el período.")
+@app.callback(
+    Output('mapa-interactivo', 'figure'),
+    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value')]
+)
+@metricas.instrumentar('renderizar_mapa')
+def renderizar_mapa(filtro, metrica):
+    if not filtro:
+        return go.Figure()
+    datos = obtener_datos()
+
+    def construir():
+        df_filtrado = obtener_filtrado(datos, filtro)
+        if df_filtrado.empty:
+            return go.Figure()
+        with metricas.tramo('mapa'):
+            return figura_mapa(celdas_filtro(datos, df_filtrado)[1], metrica)
+    return figura_en_cache(datos, ('mapa', clave_filtro(filtro), metrica), construir)
 
-    fig_box = px.box(df_filtrado, x='ciudad', y=metrica, points='outliers', template='plotly_dark')
-    fig_box.update_layout(showlegend=False)
+@app.callback(
+    Output('grafico-anomalias', 'figure'),
+    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value')]
+)
+@metricas.instrumentar('renderizar_anomalias')
+def renderizar_anomalias(filtro, metrica):
+    if not filtro:
+        return go.Figure()
+    datos = obtener_datos()
+
+    def construir():
+        df_filtrado = obtener_filtrado(datos, filtro)
+        if df_filtrado.empty:
+            return go.Figure()
+        with metricas.tramo('anomalias'):
+            ciudades_sel, celdas = celdas_filtro(datos, df_filtrado)
+            return figura_anomalias(datos, ciudades_sel, celdas, metrica)
+    return figura_en_cache(datos, ('anomalias', clave_filtro(filtro), metrica), construir)
 
-    return kpis, fig_series, fig_map, fig_anom, fig_box
+@app.callback(
+    Output('grafico-distribucion', 'figure'),
+    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value')]
+)
+@metricas.instrumentar('renderizar_distribucion')
+def renderizar_distribucion(filtro, metrica):
+    if not filtro:
+        return go.Figure()
+    datos = obtener_datos()
+
+    def construir():
+        df_filtrado = obtener_filtrado(datos, filtro)
+        if df_filtrado.empty:
+            return go.Figure()
+        with metricas.tramo('distribucion'):
+            return figura_distribucion(df_filtrado, metrica)
+    return figura_en_cache(datos, ('distribucion', clave_filtro(filtro), metrica), construir)
+
+# Tras una recarga de datos, las sesiones abiertas ven los años y la versión nuevos
+@app.callback(
+    [Output('version-datos', 'data'), Output('selector-año-inicio', 'options'), Output('selector-año-fin', 'options'),
+     Output('version-info', 'children')],
+    [Input('intervalo-version', 'n_intervals')],
+    [State('version-datos', 'data')]
+)
+@metricas.instrumentar('refrescar_version')
+def refrescar_version(n_intervals, version_actual):
+    datos = obtener_datos()
+    if datos.version == version_actual:
+        raise PreventUpdate
+    opciones_años = [{'label': y, 'value': y} for y in datos.available_years]
+    return datos.version, opciones_años, opciones_años, texto_version(datos)
+
+# La serie va aparte para poder rehacerla al hacer zoom sin tocar los demás paneles
+@app.callback(
+    Output('grafico-serie-tiempo', 'figure'),
+    [Input('df-filtrado', 'data'), Input('selector-metrica', 'value'), Input('opciones-graficos', 'value'),
+     Input('grafico-serie-tiempo', 'relayoutData')]
+)
+@metricas.instrumentar('renderizar_serie')
+def renderizar_serie(filtro, metrica, opciones, relayout):
+    rango = None
+    if id_disparador() == 'grafico-serie-tiempo':
+        # Solo los cambios del eje x justifican volver a muestrear
+        if not relayout or not any(k.startswith('xaxis.') for k in relayout):
+            raise PreventUpdate
+        rango = rango_zoom(relayout)
+
+    if not filtro:
+        return go.Figure()
+    datos = obtener_datos()
+
+    def construir():
+        df_filtrado = obtener_filtrado(datos, filtro)
+        if df_filtrado.empty:
+            return go.Figure()
+        with metricas.tramo('serie'):
+            return figura_serie(df_filtrado, metrica, opciones, rango)
+    if rango is not None:
+        # Los rangos de zoom casi nunca se repiten: no vale la pena guardarlos
+        return construir()
+    return figura_en_cache(datos, ('serie', clave_filtro(filtro), metrica, tuple(sorted(opciones or []))), construir)
 
 # --------------------
 # 6) EJECUTAR
@@ -0,0 +1,305 @@
+# benchmark_dashboard.py - latencia, tamaño y memoria de los callbacks del dashboard
+#
+# Uso: python benchmark_dashboard.py --escalas 1 8 --repeticiones 5 --salida actual.json
+#      python benchmark_dashboard.py --escalas 1 8 --rapido --alternancias 5
+#      python benchmark_dashboard.py --comparar antes.json despues.json
+# Llama a los callbacks y a los helpers de cada panel directamente (sin
+# navegador) sobre los datos reales y sobre copias sintéticas con más ciudades.
+
+import os
+
+os.environ.setdefault('CLIMA_MODO_CARGA', 'inmediata')
+os.environ.setdefault('CLIMA_INTERVALO_RECARGA', '0')
+
+import argparse
+import itertools
+import json
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.io.json
+import plotly.utils
+
+import almacen_clima
+import app
+
+ETAPAS = ['filtro', 'serializar', 'parsear', 'cubo', 'kpis', 'mapa', 'anomalias', 'distribucion', 'serie',
+          'serializar_figuras']
+PANELES = ['kpis', 'mapa', 'anomalias', 'distribucion', 'serie']
+CIUDADES = (1, 4, 16)
+PERIODOS = {'1 mes': 1, '1 año': 12, '10 años': 120}
+OPCIONES = {'base': [], 'ma7': ['ma7'], 'smooth': ['smooth'], 'ma7+smooth': ['ma7', 'smooth']}
+# Callbacks que Dash dispara al cambiar la métrica; las opciones solo disparan la serie
+SALIDAS = {
+    'kpis': lambda filtro, metrica, opciones: app.renderizar_kpis(filtro, metrica),
+    'mapa': lambda filtro, metrica, opciones: app.renderizar_mapa(filtro, metrica),
+    'anomalias': lambda filtro, metrica, opciones: app.renderizar_anomalias(filtro, metrica),
+    'distribucion': lambda filtro, metrica, opciones: app.renderizar_distribucion(filtro, metrica),
+    'serie': lambda filtro, metrica, opciones: app.renderizar_serie(filtro, metrica, opciones, None),
+}
+
+
+def datos_escalados(base, factor):
+    # Copias de cada ciudad con valores algo perturbados y coordenadas
+    # corridas; factor=1 deja los datos reales
+    if factor == 1:
+        return base
+    crudo = base.df[almacen_clima.COLUMNAS].copy()
+    crudo['ciudad'] = crudo['ciudad'].astype(str)
+    rng = np.random.default_rng(0)
+    copias, coords = [crudo], [app.df_coords]
+    for k in range(1, factor):
+        copia = crudo.copy()
+        copia['ciudad'] = copia['ciudad'] + f' #{k}'
+        for columna in almacen_clima.COLUMNAS_METRICAS:
+            copia[columna] = (copia[columna] + rng.normal(0, 0.5, len(copia))).astype('float32')
+        copias.append(copia)
+        coords_copia = app.df_coords.copy()
+        coords_copia['ciudad'] = coords_copia['ciudad'] + f' #{k}'
+        coords_copia['lon'] = coords_copia['lon'] + 0.05 * k
+        coords.append(coords_copia)
+    app.df_coords = pd.concat(coords, ignore_index=True).drop_duplicates('ciudad')
+    indice = app.preparar_dataframe(pd.concat(copias, ignore_index=True))
+    return app.armar_datos(indice)
+
+
+def selecciones(datos, metricas, opciones):
+    fin = datos.fecha_max
+    ciudades = datos.ciudades_disponibles
+    for n, (periodo, meses), metrica, (nombre_opciones, valores) in itertools.product(
+            CIUDADES, PERIODOS.items(), metricas, opciones.items()):
+        # Ciudades repartidas por toda la lista, no solo las primeras
+        elegidas = [ciudades[i] for i in np.linspace(0, len(ciudades) - 1, min(n, len(ciudades))).astype(int)]
+        inicio = fin.to_period('M') - (meses - 1)
+        yield {
+            'ciudades': n, 'periodo': periodo, 'metrica': metrica, 'opciones': nombre_opciones,
+            'args': (elegidas, inicio.year, inicio.month, fin.year, fin.month), 'valores_opciones': valores,
+        }
+
+
+def tamano_json(valor):
+    return len(json.dumps(valor, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def ejecutar_etapas(datos, seleccion, medir):
+    # medir(nombre, funcion) corre la etapa y devuelve su resultado
+    app.cache_filtrados.limpiar()
+    app.cache_figuras.limpiar()
+    metrica, opciones = seleccion['metrica'], seleccion['valores_opciones']
+    filtro = medir('filtro', lambda: app.actualizar_store(1, *seleccion['args']))
+    payload = medir('serializar', lambda: json.dumps(filtro))
+    df_filtrado = medir('parsear', lambda: app.obtener_filtrado(datos, json.loads(payload)))
+    if df_filtrado.empty:
+        # Como en los callbacks: sin filas no se arma ningún panel
+        return 0, None
+    ciudades_sel, celdas = medir('cubo', lambda: app.celdas_filtro(datos, df_filtrado))
+    salidas = {
+        'kpis': medir('kpis', lambda: app.panel_kpis(df_filtrado, celdas, metrica)),
+        'mapa': medir('mapa', lambda: app.figura_mapa(celdas, metrica)),
+        'anomalias': medir('anomalias', lambda: app.figura_anomalias(datos, ciudades_sel, celdas, metrica)),
+        'distribucion': medir('distribucion', lambda: app.figura_distribucion(df_filtrado, metrica)),
+        'serie': medir('serie', lambda: app.figura_serie(df_filtrado, metrica, opciones)),
+    }
+    tamanos = medir('serializar_figuras', lambda: {p: tamano_json(s) for p, s in salidas.items()})
+    tamanos['store'] = len(payload)
+    return len(df_filtrado), tamanos
+
+
+def medir_combinacion(datos, seleccion, repeticiones):
+    tiempos = {e: [] for e in ETAPAS}
+
+    def cronometrar(nombre, funcion):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos[nombre].append(time.perf_counter() - inicio)
+        return resultado
+
+    for _ in range(repeticiones):
+        filas, tamanos = ejecutar_etapas(datos, seleccion, cronometrar)
+        if tamanos is None:
+            return None
+
+    # Memoria en una pasada aparte: tracemalloc distorsiona los tiempos
+    picos = {}
+
+    def pico_memoria(nombre, funcion):
+        tracemalloc.reset_peak()
+        antes = tracemalloc.get_traced_memory()[0]
+        resultado = funcion()
+        picos[nombre] = tracemalloc.get_traced_memory()[1] - antes
+        return resultado
+
+    tracemalloc.start()
+    try:
+        ejecutar_etapas(datos, seleccion, pico_memoria)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'filas': filas,
+        'etapas': {e: {'p50_ms': 1e3 * float(np.percentile(t, 50)), 'p95_ms': 1e3 * float(np.percentile(t, 95)),
+                       'pico_kb': picos[e] / 1024} for e, t in tiempos.items()},
+        'total_p50_ms': 1e3 * float(np.percentile(np.sum([tiempos[e] for e in ETAPAS], axis=0), 50)),
+        'bytes': tamanos,
+    }
+
+
+def disparar(salidas, filtro, metrica, opciones):
+    # Como en Dash: cada callback y la serialización de su respuesta
+    inicio = time.perf_counter()
+    for salida in salidas:
+        plotly.io.json.to_json_plotly(SALIDAS[salida](filtro, metrica, opciones))
+    return 1e3 * (time.perf_counter() - inicio)
+
+
+def medir_alternancias(datos, metricas, rondas):
+    # Usuario que va y vuelve entre métricas y opciones sobre hasta 16 ciudades
+    # y 10 años. La primera ronda de métricas arma cada figura; las demás
+    # deberían salir del cache de figuras.
+    app.cache_filtrados.limpiar()
+    app.cache_figuras.limpiar()
+    seleccion = next(s for s in selecciones(datos, metricas[:1], {'base': []})
+                     if s['ciudades'] == 16 and s['periodo'] == '10 años')
+    filtro = app.actualizar_store(1, *seleccion['args'])
+    por_metrica = [disparar(SALIDAS, filtro, m, []) for _ in range(rondas) for m in metricas]
+    por_opciones = [disparar(['serie'], filtro, metricas[0], o)
+                    for _ in range(rondas) for o in (['ma7', 'smooth'], [])]
+    tibias = por_metrica[len(metricas):] or por_metrica
+    return {
+        'ciudades': len(filtro['ciudades']), 'filas': len(app.obtener_filtrado(datos, filtro)),
+        'metrica_primera_ms': round(float(np.median(por_metrica[:len(metricas)])), 1),
+        'metrica_p50_ms': round(float(np.percentile(tibias, 50)), 1),
+        'metrica_p95_ms': round(float(np.percentile(tibias, 95)), 1),
+        'opciones_p50_ms': round(float(np.percentile(por_opciones, 50)), 1),
+        'opciones_p95_ms': round(float(np.percentile(por_opciones, 95)), 1),
+    }
+
+
+def resumir(mediciones):
+    # Por (escala, ciudades, periodo): percentiles sobre todas las métricas y opciones
+    grupos = {}
+    for m in mediciones:
+        grupos.setdefault((m['escala'], m['ciudades'], m['periodo']), []).append(m)
+    resumen = []
+    for (escala, ciudades, periodo), ms in grupos.items():
+        fila = {'escala': escala, 'ciudades': ciudades, 'periodo': periodo, 'filas': ms[0]['filas'], 'etapas': {}}
+        for e in ETAPAS:
+            p50s = [m['etapas'][e]['p50_ms'] for m in ms]
+            fila['etapas'][e] = {
+                'p50_ms': round(float(np.percentile(p50s, 50)), 3),
+                'p95_ms': round(float(np.percentile([m['etapas'][e]['p95_ms'] for m in ms], 95)), 3),
+                'pico_kb': round(max(m['etapas'][e]['pico_kb'] for m in ms), 1),
+            }
+        totales = [m['total_p50_ms'] for m in ms]
+        fila['total_p50_ms'] = round(float(np.percentile(totales, 50)), 3)
+        fila['total_p95_ms'] = round(float(np.percentile(totales, 95)), 3)
+        fila['bytes_max'] = {p: max(m['bytes'][p] for m in ms) for p in PANELES + ['store']}
+        resumen.append(fila)
+    return resumen
+
+
+def imprimir(resumen):
+    print(f"{'escala':>6} {'ciud':>4} {'periodo':>8} {'filas':>8} {'p50':>8} {'p95':>8}  "
+          + ' '.join(f'{e[:8]:>8}' for e in ETAPAS) + '  bytes serie  pico serie')
+    for f in resumen:
+        print(f"{f['escala']:>6} {f['ciudades']:>4} {f['periodo']:>8} {f['filas']:>8} {f['total_p50_ms']:>8.1f} "
+              f"{f['total_p95_ms']:>8.1f}  " + ' '.join(f"{f['etapas'][e]['p50_ms']:>8.1f}" for e in ETAPAS)
+              + f"  {f['bytes_max']['serie']:>11} {f['etapas']['serie']['pico_kb']:>8.0f}KB")
+
+
+def comparar(ruta_antes, ruta_despues, umbral=1.2):
+    # Razón de p50 por etapa entre dos corridas; marca lo que empeoró más que el umbral
+    with open(ruta_antes, encoding='utf-8') as f:
+        antes = {(g['escala'], g['ciudades'], g['periodo']): g for g in json.load(f)['resumen']}
+    with open(ruta_despues, encoding='utf-8') as f:
+        despues = json.load(f)['resumen']
+    regresiones = 0
+    for g in despues:
+        previo = antes.get((g['escala'], g['ciudades'], g['periodo']))
+        if previo is None:
+            continue
+        razones = []
+        for e in ['total'] + ETAPAS:
+            a = previo['total_p50_ms'] if e == 'total' else previo['etapas'][e]['p50_ms']
+            d = g['total_p50_ms'] if e == 'total' else g['etapas'][e]['p50_ms']
+            razon = d / a if a > 0 else float('nan')
+            marca = '!' if razon > umbral and d - a > 1 else ' '
+            regresiones += marca == '!'
+            razones.append(f"{e[:8]}={razon:4.2f}{marca}")
+        print(f"{g['escala']:>3}x {g['ciudades']:>2} ciud {g['periodo']:>8}: " + ' '.join(razones))
+    print(f"\n{regresiones} etapas más de {umbral:.1f}x más lentas (y más de 1 ms)")
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los callbacks del dashboard')
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 8],
+                        help='factores de ciudades sintéticas (1 = datos reales)')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--rapido', action='store_true', help='solo temp_max_c y opciones base / ma7+smooth')
+    parser.add_argument('--alternancias', type=int, default=0, metavar='RONDAS',
+                        help='además, rondas de cambios de métrica y de opciones sobre 16 ciudades y 10 años')
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTES', 'DESPUES'), help='compara dos JSON y termina')
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    metricas = ['temp_max_c'] if args.rapido else list(app.metricas_disponibles)
+    opciones = {k: OPCIONES[k] for k in ('base', 'ma7+smooth')} if args.rapido else OPCIONES
+    base = app.obtener_datos()
+    coords_reales = app.df_coords
+    mediciones, alternancias, vacias = [], [], []
+    for escala in args.escalas:
+        app.df_coords = coords_reales
+        inicio = time.perf_counter()
+        datos = datos_escalados(base, escala)
+        print(f"escala {escala}: {len(datos.df)} filas, {len(datos.ciudades_disponibles)} ciudades "
+              f"(preparado en {time.perf_counter() - inicio:.1f}s)", flush=True)
+        app.datos = datos
+        for seleccion in selecciones(datos, metricas, opciones):
+            resultado = medir_combinacion(datos, seleccion, args.repeticiones)
+            descripcion = {'escala': escala, **{k: v for k, v in seleccion.items()
+                                                if k not in ('args', 'valores_opciones')}}
+            # Ciudades sin filas en el período (p. ej. tras una extracción parcial)
+            if resultado is None:
+                vacias.append({**descripcion, 'elegidas': seleccion['args'][0]})
+                continue
+            mediciones.append({**descripcion, **resultado})
+        if args.alternancias:
+            alternancias.append({'escala': escala, **medir_alternancias(datos, list(app.metricas_disponibles),
+                                                                        args.alternancias)})
+    app.datos, app.df_coords = base, coords_reales
+
+    resumen = resumir(mediciones)
+    imprimir(resumen)
+    if vacias:
+        print(f"{len(vacias)} combinaciones sin filas, no medidas: "
+              + ', '.join(sorted({f"{v['escala']}x {v['ciudades']} ciud {v['periodo']}" for v in vacias})))
+    for a in alternancias:
+        print(f"alternancias escala {a['escala']} ({a['ciudades']} ciudades, {a['filas']} filas): "
+              f"métrica primera vez {a['metrica_primera_ms']:.1f} ms, luego p50 {a['metrica_p50_ms']:.1f} / "
+              f"p95 {a['metrica_p95_ms']:.1f} ms; opciones p50 {a['opciones_p50_ms']:.1f} / "
+              f"p95 {a['opciones_p95_ms']:.1f} ms")
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'commit': commit_actual(), 'fecha': datetime.now().isoformat(timespec='seconds'),
+                       'parametros': vars(args), 'resumen': resumen, 'mediciones': mediciones,
+                       'vacias': vacias, 'alternancias': alternancias}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# benchmark_extractor.py - extractor a escala sintetica contra una API local simulada
+#
+# Uso: python benchmark_extractor.py --ubicaciones 350 5000 --procesos 1 4 --anios 1
+# Cada corrida usa un directorio temporal con su propio registro de ubicaciones
+# y almacen; la API simulada responde como el archivo de Open-Meteo.
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_EXTRACTOR = os.path.join(DIRECTORIO, 'extractor_clima_script.py')
+
+
+class ApiSimulada(BaseHTTPRequestHandler):
+    latencia = 0.0
+    fallos = 0.0
+    peticiones = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with ApiSimulada._lock:
+            ApiSimulada.peticiones += 1
+        rng = np.random.default_rng()
+        time.sleep(self.latencia)
+        if rng.random() < self.fallos:
+            self.send_response(503)
+            self.send_header('Retry-After', '0.1')
+            self.end_headers()
+            return
+        q = parse_qs(urlparse(self.path).query)
+        lats = q['latitude'][0].split(',')
+        lons = q['longitude'][0].split(',')
+        inicio = date.fromisoformat(q['start_date'][0])
+        n = (date.fromisoformat(q['end_date'][0]) - inicio).days + 1
+        fechas = [(inicio + timedelta(i)).isoformat() for i in range(n)]
+        ubicaciones = []
+        for lat, lon in zip(lats, lons):
+            ubicaciones.append({'latitude': float(lat), 'longitude': float(lon), 'daily': {
+                'time': fechas,
+                'temperature_2m_max': np.round(rng.uniform(5, 30, n), 1).tolist(),
+                'temperature_2m_min': np.round(rng.uniform(-2, 15, n), 1).tolist(),
+                'precipitation_sum': np.round(rng.uniform(0, 5, n), 1).tolist(),
+                'wind_speed_10m_max': np.round(rng.uniform(5, 40, n), 1).tolist(),
+            }})
+        cuerpo = json.dumps(ubicaciones[0] if len(ubicaciones) == 1 else ubicaciones).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+def registro_sintetico(n, ruta):
+    # Grilla regular sobre el territorio continental
+    lado = int(np.ceil(np.sqrt(n)))
+    lats = np.linspace(-18.5, -53.5, lado)
+    lons = np.linspace(-73.5, -67.5, lado)
+    puntos = [(lat, lon) for lat in lats for lon in lons][:n]
+    df = pd.DataFrame({
+        'id': [f'p{i:05d}' for i in range(n)],
+        'nombre': [f'Punto {i:05d}' for i in range(n)],
+        'lat': [round(p[0], 4) for p in puntos],
+        'lon': [round(p[1], 4) for p in puntos],
+        'region': 'sintetica',
+    })
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    df.to_csv(ruta, index=False)
+
+
+def tamano(patron):
+    return sum(os.path.getsize(r) for r in glob.glob(patron, recursive=True))
+
+
+def correr(n, procesos, args, url):
+    with tempfile.TemporaryDirectory() as directorio:
+        registro_sintetico(n, os.path.join(directorio, 'data', 'ubicaciones.csv'))
+        env = dict(
+            os.environ,
+            CLIMA_URL_API=url,
+            CLIMA_PROCESOS=str(procesos),
+            CLIMA_MAX_HILOS=str(args.hilos),
+            CLIMA_PETICIONES_POR_SEGUNDO=str(args.tasa),
+            CLIMA_ANIOS_HISTORIA=str(args.anios),
+            CLIMA_MAX_CIUDADES_POR_LOTE=str(args.lote),
+        )
+        env.pop('CLIMA_UBICACIONES', None)
+        tiempos, peticiones = [], []
+        for _ in range(2):
+            # La segunda corrida no tiene nada que bajar: mide el costo de planificar
+            ApiSimulada.peticiones = 0
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable, SCRIPT_EXTRACTOR], cwd=directorio, env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            tiempos.append(time.perf_counter() - inicio)
+            peticiones.append(ApiSimulada.peticiones)
+
+        raiz = os.path.join(directorio, 'data', 'clima')
+        with open(os.path.join(raiz, 'manifiesto.json'), encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        filas = sum(c['filas'] for c in manifiesto['ciudades'].values())
+        particiones = sum(len(c['particiones']) for c in manifiesto['ciudades'].values())
+        bytes_parquet = tamano(os.path.join(raiz, '**', '*.parquet'))
+        return {
+            'ubicaciones': n,
+            'procesos': procesos,
+            'segundos': round(tiempos[0], 2),
+            'segundos_sin_cambios': round(tiempos[1], 2),
+            'peticiones': peticiones[0],
+            'peticiones_sin_cambios': peticiones[1],
+            'peticiones_por_s': round(peticiones[0] / tiempos[0], 2),
+            'filas': filas,
+            'filas_por_s': round(filas / tiempos[0]),
+            'particiones': particiones,
+            'mb_parquet': round(bytes_parquet / 2 ** 20, 2),
+            'bytes_por_fila': round(bytes_parquet / filas, 2) if filas else None,
+            'mb_manifiesto': round(os.path.getsize(os.path.join(raiz, 'manifiesto.json')) / 2 ** 20, 2),
+            'mb_trabajos': round(tamano(os.path.join(directorio, 'data', 'trabajos.sqlite*')) / 2 ** 20, 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extractor a escala sintetica contra una API simulada')
+    parser.add_argument('--ubicaciones', type=int, nargs='+', default=[350, 5000])
+    parser.add_argument('--procesos', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--anios', type=int, default=1, help='años de historia a descargar')
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--lote', type=int, default=50, help='ubicaciones por peticion')
+    parser.add_argument('--tasa', type=float, default=1000, help='peticiones/s permitidas')
+    parser.add_argument('--latencia', type=float, default=0.05, help='latencia simulada (s)')
+    parser.add_argument('--fallos', type=float, default=0.0, help='fraccion de respuestas 503')
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    ApiSimulada.latencia = args.latencia
+    ApiSimulada.fallos = args.fallos
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ApiSimulada)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{servidor.server_address[1]}/v1/archive'
+
+    resultados = []
+    for n in args.ubicaciones:
+        for procesos in args.procesos:
+            r = correr(n, procesos, args, url)
+            resultados.append(r)
+            print(f"{r['ubicaciones']:>6} ubic. {r['procesos']:>2} proc.: {r['segundos']:>7.1f}s "
+                  f"({r['segundos_sin_cambios']:.1f}s sin cambios) {r['peticiones']:>5} pet. "
+                  f"{r['filas_por_s']:>8} filas/s | {r['filas']:>9} filas {r['particiones']:>6} particiones "
+                  f"{r['mb_parquet']:>8.1f} MB parquet ({r['bytes_por_fila']} B/fila) "
+                  f"manifiesto {r['mb_manifiesto']} MB trabajos {r['mb_trabajos']} MB", flush=True)
+    servidor.shutdown()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# benchmark_indice.py - latencia de IndiceClima segun el tamano de los datos
+#
+# Uso: python benchmark_indice.py --anios 10 50 100 --ciudades 16 350
+# Compara IndiceClima.consultar con el filtro anterior (copia del dataframe y
+# mascaras por ciudad y fecha) sobre datos diarios sinteticos.
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import almacen_clima
+from indice_clima import IndiceClima
+
+FIN = pd.Timestamp('2025-12-31')
+
+
+def datos_sinteticos(anios, n_ciudades):
+    fechas = pd.date_range(FIN - pd.DateOffset(years=anios) + pd.Timedelta(days=1), FIN, freq='D')
+    ciudades = [f'Ciudad {i:03d}' for i in range(n_ciudades)]
+    rng = np.random.default_rng(0)
+    n = len(fechas) * n_ciudades
+    df = pd.DataFrame({
+        'ciudad': pd.Categorical(np.repeat(ciudades, len(fechas)), categories=ciudades),
+        'fecha': np.tile(fechas.to_numpy(), n_ciudades),
+    })
+    for columna in almacen_clima.COLUMNAS_METRICAS:
+        df[columna] = rng.normal(15, 8, n).astype('float32')
+    df['mes'] = df['fecha'].dt.month.astype('int8')
+    df['año'] = df['fecha'].dt.year.astype('int16')
+    return df, ciudades
+
+
+def filtro_anterior(df, ciudades, desde, hasta):
+    # El filtrar_dataframe previo al indice
+    df_local = df.copy()
+    if ciudades:
+        df_local = df_local[df_local['ciudad'].isin(ciudades)]
+    if desde:
+        df_local = df_local[df_local['fecha'] >= pd.to_datetime(desde)]
+    if hasta:
+        df_local = df_local[df_local['fecha'] <= pd.to_datetime(hasta)]
+    return df_local
+
+
+def mejor_de(repeticiones, funcion):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return 1e3 * min(tiempos), resultado
+
+
+def consultas(ciudades):
+    # Ciudades repartidas por toda la lista y rangos que terminan en FIN
+    def elegir(n):
+        return [ciudades[i] for i in np.linspace(0, len(ciudades) - 1, min(n, len(ciudades))).astype(int)]
+    return {
+        '2 ciudades, 1 anio': (elegir(2), (FIN - pd.DateOffset(years=1)).strftime('%Y-%m-%d'), FIN.strftime('%Y-%m-%d')),
+        '16 ciudades, 10 anios': (elegir(16), (FIN - pd.DateOffset(years=10)).strftime('%Y-%m-%d'),
+                                  FIN.strftime('%Y-%m-%d')),
+    }
+
+
+def correr(anios, n_ciudades, repeticiones):
+    df, ciudades = datos_sinteticos(anios, n_ciudades)
+    # Se construye sobre el df desordenado, como al cargar datos sin snapshot
+    desordenado = df.sample(frac=1, random_state=0)
+    inicio = time.perf_counter()
+    indice = IndiceClima(desordenado)
+    construccion = 1e3 * (time.perf_counter() - inicio)
+    del desordenado
+    resultado = {'anios': anios, 'ciudades': n_ciudades, 'filas': len(df), 'construccion_ms': round(construccion, 1)}
+    for nombre, (elegidas, desde, hasta) in consultas(ciudades).items():
+        antes, esperado = mejor_de(repeticiones, lambda: filtro_anterior(df, elegidas, desde, hasta))
+        despues, obtenido = mejor_de(repeticiones, lambda: indice.consultar(elegidas, desde, hasta))
+        if len(obtenido) != len(esperado):
+            raise AssertionError(f"{nombre}: {len(obtenido)} filas con el indice y {len(esperado)} antes")
+        resultado[nombre] = {'filas': len(obtenido), 'anterior_ms': round(antes, 3), 'indice_ms': round(despues, 3)}
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latencia de IndiceClima contra el filtro con mascaras')
+    parser.add_argument('--anios', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--ciudades', type=int, nargs='+', default=[16, 350])
+    parser.add_argument('--repeticiones', type=int, default=5, help='se informa el mejor tiempo')
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    nombres = list(consultas(['x']))
+    print(f"{'anios':>5} {'ciud':>5} {'filas':>10} {'armar':>8} | "
+          + ' | '.join(f'{n} (antes / indice, ms)' for n in nombres), flush=True)
+    resultados = []
+    for anios in args.anios:
+        for n_ciudades in args.ciudades:
+            r = correr(anios, n_ciudades, args.repeticiones)
+            resultados.append(r)
+            print(f"{anios:>5} {n_ciudades:>5} {r['filas']:>10} {r['construccion_ms']:>8.0f} | "
+                  + ' | '.join(f"{r[n]['anterior_ms']:>10.1f} / {r[n]['indice_ms']:<9.3f}" for n in nombres),
+                  flush=True)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
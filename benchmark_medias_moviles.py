@@ -0,0 +1,114 @@
+# benchmark_medias_moviles.py - medias moviles vectorizadas contra el calculo por ciudad
+#
+# Uso: python benchmark_medias_moviles.py --ciudades 16 300 --anios 10
+# Datos diarios sinteticos con huecos (un año completo y dias sueltos
+# faltantes en parte de las ciudades). Compara:
+#   - el bucle por ciudad del dashboard original (mascara + sort + rolling(7)),
+#   - pandas groupby().rolling('<dias>D') (misma definicion que el vectorizado),
+#   - medias_moviles con una ventana y con las tres del dashboard,
+# y verifica que el vectorizado coincide con pandas.
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from indice_clima import IndiceClima
+from medias_moviles import inicios_ventana, media_movil_agrupada
+
+VENTANAS = {'ma7': 7, 'ma30': 30, 'ma365': 365}
+METRICA = 'temp_max_c'
+
+
+def datos_sinteticos(n_ciudades, anios):
+    rng = np.random.default_rng(0)
+    fechas = pd.date_range(end='2025-12-31', periods=365 * anios, freq='D')
+    partes = []
+    for i in range(n_ciudades):
+        parte = pd.DataFrame({'ciudad': f'Ciudad {i:03d}', 'fecha': fechas,
+                              METRICA: rng.normal(15, 8, len(fechas)).astype('float32')})
+        if i % 3 == 0:
+            parte = parte[parte['fecha'].dt.year != 2018]
+        if i % 2 == 0:
+            parte = parte[rng.random(len(parte)) > 0.02]
+        partes.append(parte)
+    df = pd.concat(partes, ignore_index=True)
+    df['ciudad'] = df['ciudad'].astype('category')
+    return IndiceClima(df)
+
+
+def bucle_por_ciudad(df):
+    # Lo que hacia figura_serie con la opcion MA7 y todas las ciudades elegidas
+    resultado = {}
+    for ciudad in df['ciudad'].unique():
+        sub = df[df['ciudad'] == ciudad].sort_values('fecha')
+        resultado[ciudad] = sub[METRICA].rolling(7, min_periods=1).mean()
+    return resultado
+
+
+def pandas_por_tiempo(df, dias):
+    return (df.set_index('fecha').groupby('ciudad', observed=True)[METRICA]
+            .rolling(f'{dias}D', min_periods=1).mean().to_numpy())
+
+
+def vectorizado(indice, ventanas):
+    df = indice.df
+    fechas = df['fecha'].to_numpy()
+    return {
+        opcion: media_movil_agrupada(df[METRICA].to_numpy(), inicios_ventana(fechas, indice.tramos.values(), dias))
+        for opcion, dias in ventanas.items()
+    }
+
+
+def mejor_de(repeticiones, funcion):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return 1e3 * min(tiempos), resultado
+
+
+def correr(n_ciudades, anios, repeticiones):
+    indice = datos_sinteticos(n_ciudades, anios)
+    df = indice.df
+    bucle_ms, _ = mejor_de(repeticiones, lambda: bucle_por_ciudad(df))
+    pandas_ms, referencia = mejor_de(repeticiones, lambda: pandas_por_tiempo(df, 7))
+    ma7_ms, _ = mejor_de(repeticiones, lambda: vectorizado(indice, {'ma7': 7}))
+    todas_ms, medias = mejor_de(repeticiones, lambda: vectorizado(indice, VENTANAS))
+    diferencia = max(float(np.nanmax(np.abs(medias[op] - (referencia if op == 'ma7' else pandas_por_tiempo(df, dias)))))
+                     for op, dias in VENTANAS.items())
+    return {
+        'ciudades': n_ciudades, 'filas': len(df),
+        'bucle_por_ciudad_ms': round(bucle_ms, 1), 'pandas_rolling_7d_ms': round(pandas_ms, 1),
+        'vectorizado_ma7_ms': round(ma7_ms, 1), 'vectorizado_3_ventanas_ms': round(todas_ms, 1),
+        'max_dif_vs_pandas': diferencia,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Medias moviles vectorizadas contra el calculo por ciudad')
+    parser.add_argument('--ciudades', type=int, nargs='+', default=[16, 300])
+    parser.add_argument('--anios', type=int, default=10)
+    parser.add_argument('--repeticiones', type=int, default=3, help='se informa el mejor tiempo')
+    parser.add_argument('--salida', help='archivo JSON con los resultados')
+    args = parser.parse_args()
+
+    resultados = []
+    for n_ciudades in args.ciudades:
+        r = correr(n_ciudades, args.anios, args.repeticiones)
+        resultados.append(r)
+        print(f"{r['ciudades']:>5} ciudades {r['filas']:>9} filas: bucle por ciudad {r['bucle_por_ciudad_ms']:>7.1f} ms | "
+              f"pandas rolling 7D {r['pandas_rolling_7d_ms']:>7.1f} ms | vectorizado ma7 {r['vectorizado_ma7_ms']:>6.1f} ms, "
+              f"3 ventanas {r['vectorizado_3_ventanas_ms']:>6.1f} ms | max dif vs pandas {r['max_dif_vs_pandas']:.2e}",
+              flush=True)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
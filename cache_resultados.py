@@ -0,0 +1,83 @@
+# cache_resultados.py - cache LRU en memoria con limite de bytes
+
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def tamano_objeto(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    # Cada worker de gunicorn tiene su propia instancia; las claves contienen
+    # todo lo necesario para recalcular, asi que un fallo solo cuesta tiempo
+    def __init__(self, max_bytes, tamano=tamano_objeto):
+        self.max_bytes = max_bytes
+        self._tamano = tamano
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    @property
+    def bytes_usados(self):
+        return self._bytes
+
+    def obtener(self, clave):
+        with self._lock:
+            if clave not in self._datos:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return self._datos[clave][0]
+
+    def guardar(self, clave, valor):
+        tamano = self._tamano(valor)
+        with self._lock:
+            if clave in self._datos:
+                self._bytes -= self._datos.pop(clave)[1]
+            if tamano > self.max_bytes:
+                # Mas grande que todo el cache: se calcula pero no se guarda
+                return
+            self._datos[clave] = (valor, tamano)
+            self._bytes += tamano
+            while self._bytes > self.max_bytes:
+                _, (_, liberado) = self._datos.popitem(last=False)
+                self._bytes -= liberado
+
+    def reemplazar(self, funcion):
+        # valor = funcion(clave, valor) para cada entrada, conservando el orden
+        # LRU; los tamanos se recalculan y se respeta el limite
+        with self._lock:
+            for clave, (valor, tamano) in list(self._datos.items()):
+                nuevo = funcion(clave, valor)
+                nuevo_tamano = self._tamano(nuevo)
+                self._datos[clave] = (nuevo, nuevo_tamano)
+                self._bytes += nuevo_tamano - tamano
+            while self._bytes > self.max_bytes:
+                _, (_, liberado) = self._datos.popitem(last=False)
+                self._bytes -= liberado
+
+    def invalidar(self, predicado):
+        with self._lock:
+            claves = [c for c in self._datos if predicado(c)]
+            for clave in claves:
+                self._bytes -= self._datos.pop(clave)[1]
+            return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._bytes = 0
@@ -0,0 +1,64 @@
+# cubo_agregados.py - agregados precalculados por (ciudad, año, mes)
+
+import numpy as np
+
+DIMENSIONES = ['ciudad', 'año', 'mes']
+
+
+def construir_cubo(df, metricas):
+    # Una celda por ciudad/año/mes con suma, conteo (sin NaN), min, max y suma
+    # de cuadrados de cada metrica. Las sumas van en float64 para no perder
+    # precision al combinar muchas celdas.
+    base = df[DIMENSIONES].copy()
+    for m in metricas:
+        valores = df[m].astype('float64')
+        base[f'{m}_suma'] = valores
+        base[f'{m}_n'] = valores.notna().astype('int64')
+        base[f'{m}_min'] = valores
+        base[f'{m}_max'] = valores
+        base[f'{m}_suma2'] = valores ** 2
+
+    agregaciones = {}
+    for m in metricas:
+        agregaciones.update({
+            f'{m}_suma': 'sum', f'{m}_n': 'sum', f'{m}_min': 'min', f'{m}_max': 'max', f'{m}_suma2': 'sum',
+        })
+    cubo = base.groupby(DIMENSIONES, observed=True, as_index=False).agg(agregaciones)
+    cubo['clave_mes'] = cubo['año'].astype('int64') * 12 + cubo['mes'].astype('int64')
+    return cubo
+
+
+def seleccionar(cubo, ciudades=None, desde=None, hasta=None):
+    # desde/hasta como (año, mes), inclusivos
+    mascara = np.ones(len(cubo), dtype=bool)
+    if ciudades is not None:
+        mascara &= cubo['ciudad'].isin(list(ciudades)).to_numpy()
+    if desde is not None:
+        mascara &= cubo['clave_mes'].to_numpy() >= desde[0] * 12 + desde[1]
+    if hasta is not None:
+        mascara &= cubo['clave_mes'].to_numpy() <= hasta[0] * 12 + hasta[1]
+    return cubo[mascara]
+
+
+def medias_por(celdas, metrica, por):
+    # Media ponderada por conteo: equivale a df.groupby(por)[metrica].mean()
+    sumas = celdas.groupby(por, observed=True)[[f'{metrica}_suma', f'{metrica}_n']].sum()
+    sumas = sumas[sumas[f'{metrica}_n'] > 0]
+    return (sumas[f'{metrica}_suma'] / sumas[f'{metrica}_n']).rename(metrica)
+
+
+def estadisticos(celdas, metrica):
+    n = celdas[f'{metrica}_n'].sum()
+    if n == 0:
+        return {'n': 0, 'media': np.nan, 'min': np.nan, 'max': np.nan, 'desviacion': np.nan}
+    suma = celdas[f'{metrica}_suma'].sum()
+    media = suma / n
+    # Varianza muestral a partir de la suma de cuadrados
+    varianza = (celdas[f'{metrica}_suma2'].sum() - n * media ** 2) / (n - 1) if n > 1 else np.nan
+    return {
+        'n': int(n),
+        'media': media,
+        'min': celdas[f'{metrica}_min'].min(),
+        'max': celdas[f'{metrica}_max'].max(),
+        'desviacion': np.sqrt(max(varianza, 0.0)) if n > 1 else np.nan,
+    }
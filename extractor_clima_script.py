@@ -1,22 +1,40 @@
-import requests
 import pandas as pd
 from datetime import datetime
-import time
 import os
 import calendar
 
-# LISTA DE CAPITALES REGIONALES DE CHILE
-ciudades = {
-    "Arica": (-18.47, -70.31), "Iquique": (-20.21, -70.15),
-    "Antofagasta": (-23.65, -70.40), "Copiapo": (-27.37, -70.33),
-    "La Serena": (-29.90, -71.25), "Valparaiso": (-33.05, -71.62),
-    "Santiago": (-33.46, -70.65), "Rancagua": (-34.17, -70.74),
-    "Talca": (-35.43, -71.65), "Chillan": (-36.61, -72.10),
-    "Concepcion": (-36.83, -73.05), "Temuco": (-38.74, -72.59),
-    "Valdivia": (-39.81, -73.25), "Puerto Montt": (-41.47, -72.94),
-    "Coyhaique": (-45.57, -72.07), "Punta Arenas": (-53.16, -70.92)
-}
+import almacen_clima
+import planificador_trabajos
+import ubicaciones
+from ingesta_clima import EscritorParticiones
+from motor_descarga import MotorDescarga, Trabajo, URL_ARCHIVO
+
+# CONFIGURACION DE LA DESCARGA (sobrescribible por variables de entorno)
+URL_API = os.environ.get('CLIMA_URL_API', URL_ARCHIVO)
+MAX_HILOS = int(os.environ.get('CLIMA_MAX_HILOS', 4))
+PETICIONES_POR_SEGUNDO = float(os.environ.get('CLIMA_PETICIONES_POR_SEGUNDO', 2))
+MAX_REINTENTOS = int(os.environ.get('CLIMA_MAX_REINTENTOS', 5))
+# Agrupar en una sola peticion las ciudades que comparten rango faltante
+MODO_LOTE = os.environ.get('CLIMA_MODO_LOTE', '1') != '0'
+MAX_CIUDADES_POR_LOTE = int(os.environ.get('CLIMA_MAX_CIUDADES_POR_LOTE', 50))
+VARIABLES_DIARIAS = "temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max"
+# Escritura en streaming: respuestas en cola como maximo y tamano/antiguedad
+# de cada tanda escrita al almacen (cada tanda queda como checkpoint)
+MAX_COLA = int(os.environ.get('CLIMA_MAX_COLA', 8))
+FILAS_POR_TANDA = int(os.environ.get('CLIMA_FILAS_POR_TANDA', 50000))
+SEGUNDOS_POR_TANDA = float(os.environ.get('CLIMA_SEGUNDOS_POR_TANDA', 30))
+# Con mas de un proceso las ubicaciones se reparten en fragmentos (uno por
+# proceso) y el estado de cada trabajo queda en data/trabajos.sqlite
+PROCESOS = int(os.environ.get('CLIMA_PROCESOS', 1))
+ANIOS_HISTORIA = int(os.environ.get('CLIMA_ANIOS_HISTORIA', 10))
 
+COLUMNAS_API = {
+    'time': 'fecha',
+    'temperature_2m_max': 'temp_max_c',
+    'temperature_2m_min': 'temp_min_c',
+    'precipitation_sum': 'precipitacion_mm',
+    'wind_speed_10m_max': 'viento_max_kmh'
+}
 
 def iter_meses(inicio_anio, inicio_mes, fin_anio, fin_mes):
     anio = inicio_anio
@@ -50,133 +68,281 @@ def agrupar_rangos_meses(meses_faltantes):
     return rangos
 
 
-# DEFINIR EL PERIODO DE TIEMPO
-hoy = datetime.now()
-anio_actual = hoy.year
-anio_inicio = anio_actual - 10
-if hoy.month == 1:
-    anio_fin = anio_actual - 1
-    mes_fin = 12
-else:
-    anio_fin = anio_actual
-    mes_fin = hoy.month - 1
+def rango_a_fechas(inicio_anio, inicio_mes, fin_anio, fin_mes):
+    start_date = f"{inicio_anio:04d}-{inicio_mes:02d}-01"
+    ultimo_dia = calendar.monthrange(fin_anio, fin_mes)[1]
+    end_date = f"{fin_anio:04d}-{fin_mes:02d}-{ultimo_dia:02d}"
+    return start_date, end_date
+
+
+def crear_trabajo(lote, start_date, end_date):
+    # lote: lista de (ciudad, lat, lon); la API acepta coordenadas separadas por coma
+    params = {
+        'latitude': ','.join(str(lat) for _, lat, _ in lote),
+        'longitude': ','.join(str(lon) for _, _, lon in lote),
+        'start_date': start_date,
+        'end_date': end_date,
+        'daily': VARIABLES_DIARIAS,
+        'timezone': 'auto',
+    }
+    return Trabajo((tuple(c for c, _, _ in lote), start_date, end_date), params)
 
-meses_objetivo = list(iter_meses(anio_inicio, 1, anio_fin, mes_fin))
-sin_meses_objetivo = not meses_objetivo
 
-output_folder = 'data'
-nombre_archivo = 'datos_climaticos_chile_10_anios.csv'
-file_path = os.path.join(output_folder, nombre_archivo)
+def agrupar_en_lotes(rangos_por_ciudad, max_por_lote=MAX_CIUDADES_POR_LOTE):
+    # rangos_por_ciudad: {ciudad: (lat, lon, [(start_date, end_date), ...])}
+    ciudades_por_rango = {}
+    for ciudad, (lat, lon, rangos) in rangos_por_ciudad.items():
+        for rango in rangos:
+            ciudades_por_rango.setdefault(rango, []).append((ciudad, lat, lon))
+
+    trabajos = []
+    for (start_date, end_date), lote in ciudades_por_rango.items():
+        for i in range(0, len(lote), max_por_lote):
+            trabajos.append(crear_trabajo(lote[i:i + max_por_lote], start_date, end_date))
+    return trabajos
+
+
+def separar_respuesta(datos_api, ciudades_lote):
+    # Con varias coordenadas la API devuelve una lista en el mismo orden pedido;
+    # con una sola devuelve el objeto directamente
+    ubicaciones = datos_api if isinstance(datos_api, list) else [datos_api]
+    if len(ubicaciones) != len(ciudades_lote):
+        raise ValueError(
+            f"Se esperaban {len(ciudades_lote)} ubicaciones y llegaron {len(ubicaciones)}"
+        )
+    frames = {}
+    for ciudad, ubicacion in zip(ciudades_lote, ubicaciones):
+        if 'daily' not in ubicacion:
+            continue
+        df_ciudad = pd.DataFrame(ubicacion['daily'])
+        df_ciudad['ciudad'] = ciudad
+        frames[ciudad] = df_ciudad
+    return frames
+
 
-df_existente = None
-if os.path.exists(file_path):
+def normalizar_respuesta(df_ciudad, start_date, end_date):
+    # Columnas canonicas y tipos; ValueError si la respuesta no calza con lo pedido
+    faltantes = set(COLUMNAS_API) - set(df_ciudad.columns)
+    if faltantes:
+        raise ValueError(f"Faltan columnas en la respuesta: {', '.join(sorted(faltantes))}")
+    df_ciudad = df_ciudad.rename(columns=COLUMNAS_API)
+    df_ciudad['fecha'] = pd.to_datetime(df_ciudad['fecha'], errors='coerce')
+    df_ciudad = df_ciudad.dropna(subset=['fecha'])
+    fuera_de_rango = ~df_ciudad['fecha'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+    if fuera_de_rango.any():
+        raise ValueError(f"{int(fuera_de_rango.sum())} fechas fuera del rango pedido")
+    for columna in almacen_clima.COLUMNAS_METRICAS:
+        df_ciudad[columna] = pd.to_numeric(df_ciudad[columna], errors='coerce')
+    return df_ciudad[almacen_clima.COLUMNAS]
+
+
+def frames_de_resultado(resultado):
+    # Frames ya normalizados de un resultado y los avisos de lo que se descarto
+    lote, start_date, end_date = resultado.trabajo.clave
+    nombres = ', '.join(lote)
+    if resultado.error is not None:
+        return [], [f"Error al extraer {nombres} {start_date} a {end_date} "
+                    f"tras {resultado.intentos} intentos: {resultado.error}"]
     try:
-        df_existente = pd.read_csv(file_path)
-        if 'fecha' in df_existente.columns:
-            df_existente['fecha'] = pd.to_datetime(df_existente['fecha'], errors='coerce')
-        else:
-            print("Archivo existente sin columna 'fecha'. Se ignorara para faltantes.")
-            df_existente = None
-        if df_existente is not None and 'ciudad' not in df_existente.columns:
-            print("Archivo existente sin columna 'ciudad'. Se ignorara para faltantes.")
-            df_existente = None
-    except Exception as e:
-        print(f"No se pudo leer el archivo existente: {e}")
-        df_existente = None
-
-datos_totales = []
-total_meses_faltantes = 0
-print("Iniciando la extraccion de datos climaticos (append)...")
-
-if not sin_meses_objetivo:
-    # BUCLE PRINCIPAL POR CIUDAD
+        frames = separar_respuesta(resultado.datos, lote)
+    except ValueError as e:
+        return [], [f"Respuesta invalida para {nombres} {start_date} a {end_date}: {e}"]
+    normalizados, avisos = [], []
+    for ciudad in lote:
+        if ciudad not in frames:
+            avisos.append(f"No se encontraron datos 'daily' para {ciudad} {start_date} a {end_date}.")
+            continue
+        try:
+            normalizados.append(normalizar_respuesta(frames[ciudad], start_date, end_date))
+        except ValueError as e:
+            avisos.append(f"Datos invalidos para {ciudad} {start_date} a {end_date}: {e}")
+    return normalizados, avisos
+
+
+def planificar(ciudades, manifiesto, meses_objetivo):
+    # {ciudad: (lat, lon, [(start_date, end_date), ...])} y el total de meses faltantes
+    rangos_por_ciudad = {}
+    total_meses_faltantes = 0
     for ciudad, (lat, lon) in ciudades.items():
-        print(f"\nProcesando {ciudad}...")
-        datos_ciudad = []
-
-        meses_existentes = set()
-        if df_existente is not None:
-            df_ciudad_existente = df_existente[df_existente['ciudad'] == ciudad].dropna(
-                subset=['fecha']
-            )
-            meses_existentes = set(
-                zip(df_ciudad_existente['fecha'].dt.year, df_ciudad_existente['fecha'].dt.month)
-            )
-
-        meses_faltantes = [m for m in meses_objetivo if m not in meses_existentes]
+        # Incluye meses parciales (menos dias que el calendario) para volver a pedirlos
+        meses_faltantes = almacen_clima.meses_incompletos(manifiesto, ciudad, meses_objetivo)
         total_meses_faltantes += len(meses_faltantes)
 
         if not meses_faltantes:
-            print("  - No hay meses faltantes. Saltando.")
+            print(f"  - {ciudad}: no hay meses faltantes. Saltando.")
             continue
 
-        rangos = agrupar_rangos_meses(meses_faltantes)
-        for inicio_anio, inicio_mes, fin_anio, fin_mes in rangos:
-            start_date = f"{inicio_anio:04d}-{inicio_mes:02d}-01"
-            ultimo_dia = calendar.monthrange(fin_anio, fin_mes)[1]
-            end_date = f"{fin_anio:04d}-{fin_mes:02d}-{ultimo_dia:02d}"
-            print(f"  - Extrayendo: {start_date} a {end_date}...")
-
-            url = (
-                f"https://archive-api.open-meteo.com/v1/archive?"
-                f"latitude={lat}&longitude={lon}&"
-                f"start_date={start_date}&end_date={end_date}&"
-                "daily=temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max&"
-                "timezone=auto"
-            )
+        rangos = [rango_a_fechas(*r) for r in agrupar_rangos_meses(meses_faltantes)]
+        for start_date, end_date in rangos:
+            print(f"  - {ciudad}: {start_date} a {end_date}")
+        rangos_por_ciudad[ciudad] = (lat, lon, rangos)
+    return rangos_por_ciudad, total_meses_faltantes
+
+
+def descargar_en_proceso(trabajos):
+    # Un proceso: cada respuesta se valida y pasa al escritor apenas llega;
+    # nada se acumula hasta el final
+    escritor = EscritorParticiones(max_cola=MAX_COLA, filas_por_tanda=FILAS_POR_TANDA,
+                                   segundos_por_tanda=SEGUNDOS_POR_TANDA)
+    with escritor, MotorDescarga(URL_API, max_hilos=MAX_HILOS, tasa=PETICIONES_POR_SEGUNDO,
+                                 max_reintentos=MAX_REINTENTOS) as motor:
+        try:
+            for resultado in motor.ejecutar(trabajos):
+                frames, avisos = frames_de_resultado(resultado)
+                for aviso in avisos:
+                    print(f"    -> {aviso}")
+                for df_ciudad in frames:
+                    escritor.enviar(df_ciudad)
+        except RuntimeError as e:
+            print(f"    -> Se detiene la descarga: {e}")
+        print(f"\n{motor.resumen()}")
+
+    if escritor.error is not None:
+        print(f"\nError al escribir en el almacen: {escritor.error}")
+        print("Lo escrito en tandas anteriores quedo guardado; la proxima corrida retoma desde ahi.")
+    return escritor.filas, escritor.particiones, escritor.ultimo
 
+
+def trabajar_fragmento(fragmento, n_fragmentos, cola_salida, ruta_trabajos, config):
+    # Corre en un proceso hijo: descarga los trabajos pendientes de su fragmento
+    # y escribe sus particiones (ninguna otra ciudad cae en este fragmento). El
+    # manifiesto lo actualiza el proceso principal con los resumenes recibidos.
+    with planificador_trabajos.ColaTrabajos(ruta_trabajos) as cola_trabajos, \
+            MotorDescarga(config['url'], max_hilos=config['max_hilos'], tasa=config['tasa'],
+                          max_reintentos=config['max_reintentos']) as motor:
+        for resultado in motor.ejecutar(cola_trabajos.reclamar(fragmento)):
+            clave = resultado.trabajo.clave
+            frames, avisos = frames_de_resultado(resultado)
+            if not frames:
+                cola_trabajos.marcar_fallido(clave, '; '.join(avisos) or 'sin datos')
+                cola_salida.put((clave, 0, [], avisos, None))
+                continue
+            df_lote = pd.concat(frames, ignore_index=True)
             try:
-                response = requests.get(url, timeout=60)
-                response.raise_for_status()
-                datos_api = response.json()
-                if 'daily' in datos_api:
-                    df_rango = pd.DataFrame(datos_api['daily'])
-                    datos_ciudad.append(df_rango)
-                else:
-                    print("    -> No se encontraron datos 'daily' para el periodo.")
-                time.sleep(0.5)
-            except requests.exceptions.RequestException as e:
-                print(f"    -> Error al extraer el periodo: {e}")
-
-        if datos_ciudad:
-            df_ciudad_completo = pd.concat(datos_ciudad, ignore_index=True)
-            df_ciudad_completo['ciudad'] = ciudad
-            datos_totales.append(df_ciudad_completo)
-
-# COMBINAR, LIMPIAR Y GUARDAR
-if datos_totales:
-    df_final = pd.concat(datos_totales, ignore_index=True)
-
-    df_final.rename(columns={
-        'time': 'fecha',
-        'temperature_2m_max': 'temp_max_c',
-        'temperature_2m_min': 'temp_min_c',
-        'precipitation_sum': 'precipitacion_mm',
-        'wind_speed_10m_max': 'viento_max_kmh'
-    }, inplace=True)
-
-    df_final = df_final.dropna(subset=['fecha'])
-    df_final['fecha'] = pd.to_datetime(df_final['fecha'])
-    df_final = df_final[['ciudad', 'fecha', 'temp_max_c', 'temp_min_c', 'precipitacion_mm', 'viento_max_kmh']]
-
-    os.makedirs(output_folder, exist_ok=True)
-    escribir_header = not os.path.exists(file_path) or os.path.getsize(file_path) == 0
-    df_final.to_csv(
-        file_path,
-        mode='a',
-        header=escribir_header,
-        index=False,
-        date_format='%Y-%m-%d'
-    )
-
-    print("\nExtraccion completada!")
-    print(f"Se agregaron {len(df_final)} registros al archivo '{nombre_archivo}'")
-    print("\nVista previa de los datos agregados (ultimos registros):")
-    print(df_final.tail())
-else:
-    if sin_meses_objetivo:
+                resumenes = almacen_clima.escribir_datos_particiones(df_lote)
+            except Exception as e:
+                cola_trabajos.marcar_fallido(clave, e)
+                cola_salida.put((clave, 0, [], avisos + [f"Error al escribir {', '.join(clave[0])}: {e}"], None))
+                continue
+            cola_salida.put((clave, len(df_lote), resumenes, avisos, df_lote.tail()))
+        print(f"  [fragmento {fragmento}/{n_fragmentos}] {motor.resumen()}")
+
+
+def descargar_en_procesos(rangos_por_ciudad, n_procesos):
+    # Se reparte por ciudad antes de armar los lotes: cada lote queda entero
+    # dentro de un fragmento
+    por_fragmento = [{} for _ in range(n_procesos)]
+    for ciudad, rangos in rangos_por_ciudad.items():
+        por_fragmento[planificador_trabajos.fragmento_de(ciudad, n_procesos)][ciudad] = rangos
+    trabajos, fragmentos = [], []
+    for fragmento, rangos in enumerate(por_fragmento):
+        lotes = agrupar_en_lotes(rangos, MAX_CIUDADES_POR_LOTE if MODO_LOTE else 1)
+        trabajos.extend(lotes)
+        fragmentos.extend([fragmento] * len(lotes))
+
+    config = {
+        'url': URL_API,
+        'max_hilos': MAX_HILOS,
+        # El limite de tasa es global: se divide entre los procesos
+        'tasa': PETICIONES_POR_SEGUNDO / n_procesos,
+        'max_reintentos': MAX_REINTENTOS,
+    }
+    print(f"\nDescargando {len(trabajos)} peticiones en {n_procesos} procesos x {MAX_HILOS} hilos "
+          f"(max {PETICIONES_POR_SEGUNDO} peticiones/s en total)...")
+
+    filas_totales, particiones, ultimo = 0, set(), None
+    with planificador_trabajos.ColaTrabajos() as cola_trabajos:
+        cola_trabajos.registrar(trabajos, fragmentos)
+
+        # Los resumenes se registran en el manifiesto por tandas y recien ahi
+        # los trabajos pasan a 'hecho'
+        tanda, filas_tanda = [], 0
+
+        def registrar_tanda():
+            resumenes = [r for _, _, rs in tanda for r in rs]
+            if resumenes:
+                almacen_clima.registrar_particiones(resumenes)
+            cola_trabajos.marcar_hechos([(clave, filas) for clave, filas, _ in tanda])
+
+        # Si un proceso termina con error, lo que ya escribieron los demas se
+        # registra igual; lo del proceso caido se vuelve a planificar en la
+        # proxima corrida porque no llego al manifiesto
+        try:
+            for clave, filas, resumenes, avisos, cola_lote in planificador_trabajos.ejecutar_fragmentos(
+                    trabajar_fragmento, n_procesos, (cola_trabajos.ruta, config)):
+                for aviso in avisos:
+                    print(f"    -> {aviso}")
+                if not resumenes:
+                    continue
+                tanda.append((clave, filas, resumenes))
+                filas_tanda += filas
+                filas_totales += filas
+                particiones.update((ciudad, anio) for ciudad, anio, _ in resumenes)
+                ultimo = cola_lote
+                if filas_tanda >= FILAS_POR_TANDA:
+                    registrar_tanda()
+                    tanda, filas_tanda = [], 0
+        except RuntimeError as e:
+            print(f"\nADVERTENCIA: {e}")
+        finally:
+            if tanda:
+                registrar_tanda()
+
+        estados = cola_trabajos.estados()
+    print("\nEstado de los trabajos: " + ', '.join(f"{e}={n}" for e, n in estados.items()))
+    return filas_totales, particiones, ultimo
+
+
+def main():
+    # DEFINIR EL PERIODO DE TIEMPO
+    hoy = datetime.now()
+    anio_actual = hoy.year
+    anio_inicio = anio_actual - ANIOS_HISTORIA
+    if hoy.month == 1:
+        anio_fin = anio_actual - 1
+        mes_fin = 12
+    else:
+        anio_fin = anio_actual
+        mes_fin = hoy.month - 1
+
+    meses_objetivo = list(iter_meses(anio_inicio, 1, anio_fin, mes_fin))
+    sin_meses_objetivo = not meses_objetivo
+
+    if not almacen_clima.existe_almacen() and os.path.exists(almacen_clima.RUTA_CSV):
+        print(f"Migrando '{almacen_clima.RUTA_CSV}' al almacen Parquet...")
+        almacen_clima.migrar_csv()
+    manifiesto = almacen_clima.cargar_manifiesto()
+    ciudades = ubicaciones.coordenadas()
+
+    print(f"Iniciando la extraccion de datos climaticos (append) para {len(ciudades)} ubicaciones...")
+
+    # PLANIFICAR LOS TRABAJOS POR CIUDAD Y RANGO
+    rangos_por_ciudad, total_meses_faltantes = {}, 0
+    if not sin_meses_objetivo:
+        rangos_por_ciudad, total_meses_faltantes = planificar(ciudades, manifiesto, meses_objetivo)
+
+    # DESCARGA CONCURRENTE Y ESCRITURA EN STREAMING
+    filas, particiones, ultimo = 0, set(), None
+    if rangos_por_ciudad and PROCESOS > 1:
+        filas, particiones, ultimo = descargar_en_procesos(rangos_por_ciudad, PROCESOS)
+    elif rangos_por_ciudad:
+        trabajos = agrupar_en_lotes(rangos_por_ciudad, MAX_CIUDADES_POR_LOTE if MODO_LOTE else 1)
+        print(f"\nDescargando {len(trabajos)} peticiones con {MAX_HILOS} hilos "
+              f"(max {PETICIONES_POR_SEGUNDO} peticiones/s)...")
+        filas, particiones, ultimo = descargar_en_proceso(trabajos)
+
+    # RESUMEN
+    if filas:
+        print("\nExtraccion completada!")
+        print(f"Se agregaron {filas} registros en {len(particiones)} particiones de '{almacen_clima.RUTA_ALMACEN}'")
+        print("\nVista previa de los datos agregados (ultimos registros):")
+        print(ultimo)
+    elif sin_meses_objetivo:
         print("\nNo hay meses completos para extraer todavia.")
     elif total_meses_faltantes == 0:
         print("\nNo hay meses faltantes. No se agregaron datos.")
     else:
-        print("\nNo se pudieron extraer datos. El archivo final no fue actualizado.")
+        print("\nNo se pudieron extraer datos. El almacen no fue actualizado.")
+
+if __name__ == '__main__':
+    main()
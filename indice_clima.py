@@ -0,0 +1,71 @@
+# indice_clima.py - indice por (ciudad, fecha) para consultas por rango
+
+import numpy as np
+import pandas as pd
+
+
+class IndiceClima:
+    # Ordena una vez por (ciudad, fecha) y guarda el tramo [inicio, fin) de
+    # cada ciudad; una consulta es una busqueda binaria por ciudad sobre las
+    # fechas y devuelve tramos de filas sin recorrer el resto del dataframe
+    def __init__(self, df, ordenado=False):
+        # ordenado=True evita reordenar (y copiar) un df que ya viene por
+        # (ciudad, fecha), p. ej. uno abierto con memory map
+        if ordenado:
+            self.df = df
+        else:
+            self.df = df.sort_values(['ciudad', 'fecha'], kind='stable', ignore_index=True)
+        self._fechas = self.df['fecha'].to_numpy(dtype='datetime64[ns]').view('i8')
+
+        # Con ciudad categorica los cortes salen de los codigos, sin armar
+        # un arreglo de textos del largo del dataframe
+        ciudad = self.df['ciudad']
+        if isinstance(ciudad.dtype, pd.CategoricalDtype):
+            valores = ciudad.cat.codes.to_numpy()
+        else:
+            valores = ciudad.astype(str).to_numpy()
+        n = len(valores)
+        cortes = np.flatnonzero(valores[1:] != valores[:-1]) + 1
+        inicios = np.concatenate(([0], cortes)) if n else np.array([], dtype=int)
+        fines = np.concatenate((cortes, [n])) if n else np.array([], dtype=int)
+        nombres = ciudad.iloc[inicios].astype(str).tolist()
+        self.tramos = {nombre: (int(i), int(f)) for nombre, i, f in zip(nombres, inicios, fines)}
+        self.ciudades = list(self.tramos)
+
+    def __len__(self):
+        return len(self.df)
+
+    def _limites(self, ciudad, desde, hasta):
+        inicio, fin = self.tramos[ciudad]
+        fechas = self._fechas[inicio:fin]
+        a = inicio + (np.searchsorted(fechas, desde, side='left') if desde is not None else 0)
+        b = inicio + (np.searchsorted(fechas, hasta, side='right') if hasta is not None else len(fechas))
+        return a, b
+
+    def consultar(self, ciudades=None, desde=None, hasta=None):
+        # Fechas inclusivas. Si lo pedido es un solo tramo contiguo devuelve una
+        # vista (iloc); si no, copia solo las k filas pedidas.
+        desde = pd.Timestamp(desde).value if desde is not None else None
+        hasta = pd.Timestamp(hasta).value if hasta is not None else None
+        if ciudades:
+            pedidas = set(ciudades)
+            seleccion = [c for c in self.ciudades if c in pedidas]
+        else:
+            seleccion = self.ciudades
+
+        # Tramos contiguos (ciudades vecinas completas) se funden en uno solo
+        limites = []
+        for a, b in (self._limites(c, desde, hasta) for c in seleccion):
+            if b <= a:
+                continue
+            if limites and limites[-1][1] == a:
+                limites[-1] = (limites[-1][0], b)
+            else:
+                limites.append((a, b))
+        if not limites:
+            return self.df.iloc[0:0]
+        if len(limites) == 1:
+            a, b = limites[0]
+            return self.df.iloc[a:b]
+        posiciones = np.concatenate([np.arange(a, b) for a, b in limites])
+        return self.df.take(posiciones)
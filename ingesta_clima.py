@@ -0,0 +1,82 @@
+# ingesta_clima.py - escritura en streaming al almacen con cola acotada
+
+import queue
+import threading
+import time
+
+import pandas as pd
+
+import almacen_clima
+
+_FIN = object()
+
+
+class EscritorParticiones:
+    # Hilo que recibe frames ya normalizados por una cola acotada y los escribe
+    # en el almacen por tandas. Cada tanda actualiza el manifiesto, que sirve
+    # de checkpoint: si el proceso se corta, la siguiente corrida solo pide los
+    # meses que no alcanzaron a quedar escritos. Si la cola se llena, enviar()
+    # bloquea y la descarga espera (la memoria no crece con el backfill).
+    def __init__(self, raiz=almacen_clima.RUTA_ALMACEN, max_cola=8, filas_por_tanda=50000, segundos_por_tanda=30.0):
+        self.raiz = raiz
+        self.filas_por_tanda = filas_por_tanda
+        self.segundos_por_tanda = segundos_por_tanda
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo = threading.Thread(target=self._escribir, name='escritor-particiones', daemon=True)
+        self.error = None
+        self.filas = 0
+        self.particiones = set()
+        self.tandas = 0
+        self.ultimo = None
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def enviar(self, df):
+        if self.error is not None:
+            raise RuntimeError(f"El escritor se detuvo: {self.error}") from self.error
+        self._cola.put(df)
+
+    def cerrar(self):
+        # Escribe lo pendiente y espera al hilo
+        if self._hilo.is_alive():
+            self._cola.put(_FIN)
+            self._hilo.join()
+
+    def _guardar(self, frames):
+        df = pd.concat(frames, ignore_index=True)
+        escritas = almacen_clima.escribir_particiones(df, self.raiz)
+        self.filas += len(df)
+        self.particiones.update(escritas)
+        self.tandas += 1
+        self.ultimo = df.tail()
+
+    def _escribir(self):
+        tanda, filas, inicio_tanda = [], 0, None
+        while True:
+            try:
+                df = self._cola.get(timeout=self.segundos_por_tanda)
+            except queue.Empty:
+                df = None
+            fin = df is _FIN
+            if df is not None and not fin:
+                if not tanda:
+                    inicio_tanda = time.monotonic()
+                tanda.append(df)
+                filas += len(df)
+            vencida = bool(tanda) and time.monotonic() - inicio_tanda >= self.segundos_por_tanda
+            if tanda and (fin or filas >= self.filas_por_tanda or vencida) and self.error is None:
+                try:
+                    self._guardar(tanda)
+                except Exception as e:
+                    # Se sigue vaciando la cola para no bloquear al productor
+                    self.error = e
+                tanda, filas = [], 0
+            elif self.error is not None:
+                tanda, filas = [], 0
+            if fin:
+                return
@@ -0,0 +1,32 @@
+# medias_moviles.py - medias moviles por ciudad en una sola pasada
+
+import numpy as np
+
+NS_POR_DIA = 86_400 * 10 ** 9
+
+
+def inicios_ventana(fechas, tramos, dias):
+    # Para cada fila, la primera fila de su ciudad dentro de los ultimos
+    # `dias` dias de calendario (la propia fila incluida). La ventana se mide
+    # en fechas y no en filas: si faltan dias, tiene menos filas en vez de
+    # alcanzar datos mas viejos. fechas ordenadas dentro de cada tramo.
+    fechas = np.asarray(fechas, dtype='datetime64[ns]').view('i8')
+    limites = fechas - (dias - 1) * NS_POR_DIA
+    izquierda = np.zeros(len(fechas), dtype=np.int64)
+    for inicio, fin in tramos:
+        izquierda[inicio:fin] = inicio + np.searchsorted(fechas[inicio:fin], limites[inicio:fin], side='left')
+    return izquierda
+
+
+def media_movil_agrupada(valores, izquierda):
+    # Equivale a groupby(ciudad).rolling(f'{dias}D', on='fecha', min_periods=1)
+    # .mean() sobre filas ordenadas por (ciudad, fecha), usando sumas
+    # acumuladas; izquierda viene de inicios_ventana
+    valores = np.asarray(valores, dtype='float64')
+    validos = ~np.isnan(valores)
+    suma = np.concatenate(([0.0], np.cumsum(np.where(validos, valores, 0.0))))
+    conteo = np.concatenate(([0], np.cumsum(validos)))
+    fila = np.arange(len(valores))
+    n = conteo[fila + 1] - conteo[izquierda]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (suma[fila + 1] - suma[izquierda]) / n, np.nan)
@@ -0,0 +1,143 @@
+# metricas.py - instrumentacion opcional del dashboard y ruta /metrics (Prometheus)
+#
+# Se activa con CLIMA_METRICAS=1. Desactivada, tramo() devuelve siempre el
+# mismo contexto vacio e instrumentar() deja la funcion tal cual, asi el
+# costo en el camino caliente es una llamada y un if. Cada worker de gunicorn
+# lleva sus propias metricas (Prometheus suma por instancia).
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+import flask
+
+ACTIVO = os.environ.get('CLIMA_METRICAS', '0') == '1'
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def _numero(valor):
+    return repr(float(valor)) if valor != int(valor) else str(int(valor))
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiqueta, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor_etiqueta, valor):
+        with self._lock:
+            serie = self._series.get(valor_etiqueta)
+            if serie is None:
+                serie = self._series[valor_etiqueta] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][bisect_left(self.buckets, valor)] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        for valor_etiqueta, (conteos, suma, total) in sorted(series.items()):
+            etiqueta = f'{self.etiqueta}="{valor_etiqueta}"'
+            acumulado = 0
+            for limite, n in zip(self.buckets, conteos):
+                acumulado += n
+                lineas.append(f'{self.nombre}_bucket{{{etiqueta},le="{_numero(limite)}"}} {acumulado}')
+            lineas.append(f'{self.nombre}_bucket{{{etiqueta},le="+Inf"}} {total}')
+            lineas.append(f'{self.nombre}_sum{{{etiqueta}}} {suma!r}')
+            lineas.append(f'{self.nombre}_count{{{etiqueta}}} {total}')
+        return lineas
+
+
+TRAMOS = Histograma('clima_tramo_segundos', 'Duracion de cada tramo de los callbacks', 'tramo', BUCKETS_SEGUNDOS)
+PAYLOADS = Histograma('clima_payload_bytes', 'Bytes de cada respuesta de callback', 'callback', BUCKETS_BYTES)
+
+# Valores leidos al momento de exponer: (nombre, ayuda, tipo, funcion)
+_valores = []
+
+
+class _Tramo:
+    __slots__ = ('nombre', 'inicio')
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        TRAMOS.observar(self.nombre, time.perf_counter() - self.inicio)
+        return False
+
+
+_NULO = nullcontext()
+
+
+def tramo(nombre):
+    # with metricas.tramo('filtro'): ...
+    return _Tramo(nombre) if ACTIVO else _NULO
+
+
+def instrumentar(nombre):
+    # Decorador para callbacks: tramo 'callback_<nombre>' y marca de fin para
+    # medir la serializacion que hace Dash despues de que la funcion retorna
+    def decorador(funcion):
+        if not ACTIVO:
+            return funcion
+
+        @functools.wraps(funcion)
+        def envuelta(*args, **kwargs):
+            with tramo(f'callback_{nombre}'):
+                resultado = funcion(*args, **kwargs)
+            if flask.has_request_context():
+                flask.g.metricas_callback = nombre
+                flask.g.metricas_fin_callback = time.perf_counter()
+            return resultado
+        return envuelta
+    return decorador
+
+
+def registrar_valor(nombre, ayuda, funcion, tipo='gauge'):
+    _valores.append((nombre, ayuda, tipo, funcion))
+
+
+def exponer():
+    lineas = TRAMOS.exponer() + PAYLOADS.exponer()
+    for nombre, ayuda, tipo, funcion in _valores:
+        try:
+            valor = funcion()
+        except Exception:
+            continue
+        if valor is None:
+            continue
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}", f"{nombre} {_numero(valor)}"]
+    return '\n'.join(lineas) + '\n'
+
+
+def instrumentar_servidor(server):
+    # Registra /metrics y los hooks de Flask; no hace nada si esta desactivado
+    if not ACTIVO:
+        return
+
+    @server.after_request
+    def medir_respuesta(respuesta):
+        nombre = flask.g.pop('metricas_callback', None)
+        fin_callback = flask.g.pop('metricas_fin_callback', None)
+        if nombre is not None:
+            TRAMOS.observar('serializacion', time.perf_counter() - fin_callback)
+            PAYLOADS.observar(nombre, respuesta.calculate_content_length() or 0)
+        return respuesta
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(exponer(), mimetype='text/plain; version=0.0.4')
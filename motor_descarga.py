@@ -0,0 +1,163 @@
+# motor_descarga.py - descargas concurrentes con limite de tasa y reintentos
+
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+URL_ARCHIVO = "https://archive-api.open-meteo.com/v1/archive"
+
+# 429 (limite de la API) y errores 5xx se reintentan; el resto de 4xx no
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# clave identifica el trabajo (ej. (ciudad, inicio, fin)); params va en la query
+Trabajo = namedtuple('Trabajo', ['clave', 'params'])
+Resultado = namedtuple('Resultado', ['trabajo', 'datos', 'error', 'intentos'])
+
+
+class LimitadorTasa:
+    # Token bucket: se reponen `tasa` tokens por segundo hasta `capacidad`
+    def __init__(self, tasa, capacidad=None):
+        if tasa <= 0:
+            raise ValueError("La tasa debe ser mayor que 0")
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad) if capacidad else max(1.0, self.tasa)
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.tasa
+            time.sleep(espera)
+
+
+class ErrorReintentable(Exception):
+    def __init__(self, mensaje, espera=None):
+        super().__init__(mensaje)
+        self.espera = espera
+
+
+class MotorDescarga:
+    def __init__(self, url=URL_ARCHIVO, max_hilos=4, tasa=2.0, rafaga=None,
+                 max_reintentos=5, backoff_base=1.0, backoff_max=60.0, timeout=60, max_pendientes=None):
+        self.url = url
+        self.max_hilos = max_hilos
+        # Trabajos en vuelo como maximo: si el consumidor se atrasa no se
+        # siguen descargando respuestas que nadie lee
+        self.max_pendientes = max_pendientes or 2 * max_hilos
+        self.limitador = LimitadorTasa(tasa, rafaga)
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        # Una sola sesion con pool de conexiones del tamano del pool de hilos
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_hilos)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.estadisticas = {}
+
+    def cerrar(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def _espera_backoff(self, intento, sugerida=None):
+        if sugerida is not None:
+            return min(sugerida, self.backoff_max)
+        # Backoff exponencial con jitter completo
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+
+    def _pedir(self, params):
+        self.limitador.adquirir()
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise ErrorReintentable(str(e))
+
+        if response.status_code in CODIGOS_REINTENTABLES:
+            espera = None
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    espera = float(retry_after)
+                except ValueError:
+                    espera = None
+            raise ErrorReintentable(f"HTTP {response.status_code}", espera)
+
+        response.raise_for_status()
+        return response.json()
+
+    def _descargar(self, trabajo):
+        intento = 0
+        while True:
+            intento += 1
+            try:
+                return Resultado(trabajo, self._pedir(trabajo.params), None, intento)
+            except ErrorReintentable as e:
+                if intento > self.max_reintentos:
+                    return Resultado(trabajo, None, e, intento)
+                with self._lock_stats:
+                    self.estadisticas['reintentos'] += 1
+                time.sleep(self._espera_backoff(intento - 1, e.espera))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                return Resultado(trabajo, None, e, intento)
+
+    def ejecutar(self, trabajos):
+        # Generador: entrega cada Resultado a medida que termina. Los trabajos
+        # se toman de a uno del iterable a medida que hay lugar en vuelo
+        self._lock_stats = threading.Lock()
+        self.estadisticas = {'trabajos': 0, 'completados': 0, 'fallidos': 0, 'reintentos': 0}
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_hilos) as executor:
+                por_enviar = iter(trabajos)
+                pendientes = set()
+                while True:
+                    while len(pendientes) < self.max_pendientes:
+                        trabajo = next(por_enviar, None)
+                        if trabajo is None:
+                            break
+                        pendientes.add(executor.submit(self._descargar, trabajo))
+                        self.estadisticas['trabajos'] += 1
+                    if not pendientes:
+                        break
+                    listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        resultado = futuro.result()
+                        clave = 'fallidos' if resultado.error is not None else 'completados'
+                        self.estadisticas[clave] += 1
+                        yield resultado
+        finally:
+            tiempo = time.perf_counter() - inicio
+            self.estadisticas['tiempo_total_s'] = tiempo
+            terminados = self.estadisticas['completados'] + self.estadisticas['fallidos']
+            self.estadisticas['trabajos_por_s'] = terminados / tiempo if tiempo > 0 else 0.0
+
+    def resumen(self):
+        e = self.estadisticas
+        if not e:
+            return "Sin trabajos ejecutados."
+        return (
+            f"{e['completados']}/{e['trabajos']} trabajos completados, {e['fallidos']} fallidos, "
+            f"{e['reintentos']} reintentos en {e.get('tiempo_total_s', 0):.2f}s "
+            f"({e.get('trabajos_por_s', 0):.2f} trabajos/s)"
+        )
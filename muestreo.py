@@ -0,0 +1,85 @@
+# muestreo.py - reduccion de series para graficar (min/max y LTTB)
+
+import numpy as np
+
+ALGORITMOS = ('minmax', 'lttb', 'ninguno')
+
+
+def _cubetas(n, n_cubetas):
+    # Bordes de n_cubetas cubetas contiguas sobre los puntos interiores 1..n-2
+    return np.linspace(1, n - 1, n_cubetas + 1).astype(np.int64)
+
+
+def _primer_maximo(valores, bordes):
+    # Indice (global) del primer maximo de cada cubeta [bordes[i], bordes[i+1])
+    inicio = bordes[0]
+    tramo = valores[inicio:bordes[-1]]
+    tamanos = np.diff(bordes)
+    maximos = np.maximum.reduceat(tramo, bordes[:-1] - inicio)
+    candidatos = np.flatnonzero(tramo == np.repeat(maximos, tamanos))
+    cubeta = np.repeat(np.arange(len(tamanos)), tamanos)
+    _, primeros = np.unique(cubeta[candidatos], return_index=True)
+    return candidatos[primeros] + inicio
+
+
+def indices_minmax(y, n_puntos):
+    # Conserva el primer y ultimo punto y el minimo y maximo de cada cubeta:
+    # los extremos de la serie completa siempre sobreviven
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= n_puntos or n_puntos < 4:
+        return np.arange(n)
+    bordes = _cubetas(n, (n_puntos - 2) // 2)
+    imax = _primer_maximo(y, bordes)
+    imin = _primer_maximo(-y, bordes)
+    return np.unique(np.concatenate(([0], imin, imax, [n - 1])))
+
+
+def indices_lttb(x, y, n_puntos):
+    # Largest-Triangle-Three-Buckets vectorizado: el vertice de referencia de
+    # cada cubeta es el promedio de la cubeta anterior (no el punto elegido en
+    # ella), lo que elimina la dependencia secuencial y permite hacerlo en una
+    # sola pasada de NumPy
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= n_puntos or n_puntos < 3:
+        return np.arange(n)
+    bordes = _cubetas(n, n_puntos - 2)
+    tamanos = np.diff(bordes)
+
+    # Promedios por cubeta, con el primer y ultimo punto como cubetas propias
+    medias_x = np.concatenate(([x[0]], np.add.reduceat(x[:n - 1], bordes[:-1]) / tamanos, [x[-1]]))
+    medias_y = np.concatenate(([y[0]], np.add.reduceat(y[:n - 1], bordes[:-1]) / tamanos, [y[-1]]))
+
+    ax = np.repeat(medias_x[:-2], tamanos)
+    ay = np.repeat(medias_y[:-2], tamanos)
+    cx = np.repeat(medias_x[2:], tamanos)
+    cy = np.repeat(medias_y[2:], tamanos)
+    xi = x[1:n - 1]
+    yi = y[1:n - 1]
+    areas = np.zeros(n)
+    areas[1:n - 1] = np.abs((ax - cx) * (yi - ay) - (ax - xi) * (cy - ay))
+    return np.concatenate(([0], _primer_maximo(areas, bordes), [n - 1]))
+
+
+def reducir(x, y, n_puntos, algoritmo='minmax'):
+    # Devuelve las posiciones a conservar (ordenadas). Se reduce sobre los
+    # puntos validos y se conserva el primer NaN de cada hueco, para que el
+    # grafico siga cortando la linea donde faltan datos.
+    if algoritmo not in ALGORITMOS:
+        raise ValueError(f"Algoritmo de muestreo desconocido: {algoritmo}")
+    y = np.asarray(y, dtype='float64')
+    nulos = np.isnan(y)
+    validos = np.flatnonzero(~nulos)
+    if algoritmo == 'ninguno' or len(validos) <= n_puntos:
+        return np.arange(len(y))
+    if algoritmo == 'lttb':
+        x = np.asarray(x)
+        if np.issubdtype(x.dtype, np.datetime64):
+            x = x.astype('datetime64[ns]').view('i8')
+        elegidos = validos[indices_lttb(x[validos], y[validos], n_puntos)]
+    else:
+        elegidos = validos[indices_minmax(y[validos], n_puntos)]
+    huecos = np.flatnonzero(nulos & ~np.concatenate(([False], nulos[:-1])))
+    return np.union1d(elegidos, huecos)
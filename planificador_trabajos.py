@@ -0,0 +1,166 @@
+# planificador_trabajos.py - cola de trabajos persistente y reparto entre procesos
+
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+
+from motor_descarga import Trabajo
+
+RUTA_TRABAJOS = os.path.join('data', 'trabajos.sqlite')
+ESTADOS = ('pendiente', 'en_curso', 'hecho', 'fallido', 'obsoleto')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY,
+    clave TEXT UNIQUE NOT NULL,
+    params TEXT NOT NULL,
+    fragmento INTEGER NOT NULL,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    filas INTEGER,
+    error TEXT,
+    actualizado REAL
+);
+CREATE INDEX IF NOT EXISTS trabajos_fragmento_estado ON trabajos (fragmento, estado);
+"""
+
+
+def fragmento_de(ciudad, n_fragmentos):
+    # Estable entre corridas y procesos: una ciudad cae siempre en el mismo
+    # fragmento, asi dos procesos nunca escriben la misma particion
+    return zlib.crc32(ciudad.encode('utf-8')) % n_fragmentos
+
+
+def _clave_texto(clave):
+    ciudades, start_date, end_date = clave
+    return json.dumps([list(ciudades), start_date, end_date], ensure_ascii=False)
+
+
+class ColaTrabajos:
+    # Estado de cada trabajo en SQLite (pendiente, en_curso, hecho, fallido,
+    # obsoleto). El manifiesto del almacen sigue mandando: lo que se vuelve a
+    # planificar vuelve a 'pendiente' aunque una corrida anterior lo haya dado
+    # por hecho, y lo que una corrida anterior dejo sin terminar queda obsoleto.
+    def __init__(self, ruta=RUTA_TRABAJOS):
+        self.ruta = ruta
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._con = sqlite3.connect(ruta, timeout=60, isolation_level=None)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.executescript(ESQUEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self):
+        self._con.close()
+
+    @contextmanager
+    def _transaccion(self):
+        self._con.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._con
+        except BaseException:
+            self._con.execute('ROLLBACK')
+            raise
+        self._con.execute('COMMIT')
+
+    def registrar(self, trabajos, fragmentos):
+        ahora = time.time()
+        filas = [(_clave_texto(t.clave), json.dumps(t.params), f, ahora) for t, f in zip(trabajos, fragmentos)]
+        with self._transaccion() as con:
+            # Lo que quedo sin terminar de otra corrida puede tener otra clave u
+            # otro fragmento para la misma ciudad: si se reclamara, dos procesos
+            # escribirian la misma particion. Solo cuenta el plan actual.
+            con.execute(
+                "UPDATE trabajos SET estado = 'obsoleto', actualizado = ? WHERE estado != 'hecho'", (ahora,)
+            )
+            con.executemany(
+                "INSERT INTO trabajos (clave, params, fragmento, estado, actualizado) VALUES (?, ?, ?, 'pendiente', ?) "
+                "ON CONFLICT(clave) DO UPDATE SET params = excluded.params, fragmento = excluded.fragmento, "
+                "estado = 'pendiente', error = NULL, actualizado = excluded.actualizado",
+                filas,
+            )
+
+    def reclamar(self, fragmento):
+        # Generador: marca cada trabajo 'en_curso' recien cuando se lo pide,
+        # asi lo que no alcanzo a empezar sigue pendiente
+        while True:
+            with self._transaccion() as con:
+                fila = con.execute(
+                    "SELECT id, clave, params FROM trabajos WHERE fragmento = ? AND estado = 'pendiente' "
+                    "ORDER BY id LIMIT 1", (fragmento,)
+                ).fetchone()
+                if fila is None:
+                    return
+                con.execute(
+                    "UPDATE trabajos SET estado = 'en_curso', intentos = intentos + 1, actualizado = ? WHERE id = ?",
+                    (time.time(), fila[0]),
+                )
+            ciudades, start_date, end_date = json.loads(fila[1])
+            yield Trabajo((tuple(ciudades), start_date, end_date), json.loads(fila[2]))
+
+    def marcar_fallido(self, clave, error):
+        with self._transaccion() as con:
+            con.execute(
+                "UPDATE trabajos SET estado = 'fallido', error = ?, actualizado = ? WHERE clave = ?",
+                (str(error), time.time(), _clave_texto(clave)),
+            )
+
+    def marcar_hechos(self, claves_filas):
+        # claves_filas: [(clave, filas)]
+        ahora = time.time()
+        with self._transaccion() as con:
+            con.executemany(
+                "UPDATE trabajos SET estado = 'hecho', filas = ?, error = NULL, actualizado = ? WHERE clave = ?",
+                [(filas, ahora, _clave_texto(clave)) for clave, filas in claves_filas],
+            )
+
+    def estados(self):
+        conteo = dict(self._con.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+        return {estado: conteo.get(estado, 0) for estado in ESTADOS}
+
+
+def ejecutar_fragmentos(trabajador, n_procesos, args=(), contexto='spawn'):
+    # Lanza trabajador(fragmento, n_procesos, cola_salida, *args) en un proceso
+    # por fragmento y entrega, en el proceso principal, cada mensaje que estos
+    # ponen en cola_salida. Termina cuando todos los procesos salieron.
+    ctx = multiprocessing.get_context(contexto)
+    cola_salida = ctx.Queue(maxsize=4 * n_procesos)
+    procesos = [
+        ctx.Process(target=trabajador, args=(fragmento, n_procesos, cola_salida) + tuple(args),
+                    name=f'fragmento-{fragmento}')
+        for fragmento in range(n_procesos)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    vivos = True
+    try:
+        while True:
+            try:
+                yield cola_salida.get(timeout=0.5)
+            except queue.Empty:
+                # Una vuelta mas despues de que todos salieron, para recoger
+                # lo que pusieron justo antes de terminar
+                if not vivos:
+                    break
+                vivos = any(p.is_alive() for p in procesos)
+    except BaseException:
+        # Si el consumidor se detiene, los procesos quedarian bloqueados en la cola
+        for proceso in procesos:
+            proceso.terminate()
+        raise
+    finally:
+        for proceso in procesos:
+            proceso.join()
+    fallidos = [p.name for p in procesos if p.exitcode != 0]
+    if fallidos:
+        raise RuntimeError(f"Procesos terminados con error: {', '.join(fallidos)}")
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import almacen_clima
+from almacen_clima import (
+    COLUMNAS_METRICAS, cargar_manifiesto, escribir_particiones, meses_incompletos, particiones_cambiadas,
+)
+
+
+def dias(ciudad, desde, hasta, valor=20.0):
+    fechas = pd.date_range(desde, hasta, freq='D')
+    df = pd.DataFrame({'ciudad': ciudad, 'fecha': fechas})
+    for i, columna in enumerate(COLUMNAS_METRICAS):
+        df[columna] = valor + i
+    return df
+
+
+@pytest.fixture
+def raiz(tmp_path):
+    return str(tmp_path / 'clima')
+
+
+def test_mes_parcial_se_vuelve_a_pedir_hasta_completarse(raiz):
+    objetivo = [(2024, 1), (2024, 2)]
+    escribir_particiones(dias('Santiago', '2024-01-01', '2024-01-10'), raiz)
+    manifiesto = cargar_manifiesto(raiz)
+    assert manifiesto['ciudades']['Santiago']['particiones']['2024']['meses'] == {'01': 10}
+    assert meses_incompletos(manifiesto, 'Santiago', objetivo) == [(2024, 1), (2024, 2)]
+
+    # 2024 es bisiesto: un febrero de 28 dias sigue incompleto
+    escribir_particiones(dias('Santiago', '2024-01-11', '2024-02-28'), raiz)
+    assert meses_incompletos(cargar_manifiesto(raiz), 'Santiago', objetivo) == [(2024, 2)]
+
+    escribir_particiones(dias('Santiago', '2024-02-29', '2024-02-29'), raiz)
+    manifiesto = cargar_manifiesto(raiz)
+    assert meses_incompletos(manifiesto, 'Santiago', objetivo) == []
+    assert manifiesto['ciudades']['Santiago']['filas'] == 60
+    # Una ciudad que no esta en el manifiesto tiene todo pendiente
+    assert meses_incompletos(manifiesto, 'Arica', objetivo) == objetivo
+
+
+def test_dias_sin_ninguna_metrica_no_cuentan(raiz):
+    df = dias('Temuco', '2023-03-01', '2023-03-31')
+    df.loc[df['fecha'] >= '2023-03-21', COLUMNAS_METRICAS] = np.nan
+    # Un dia con al menos una metrica si cuenta
+    df.loc[df['fecha'] == '2023-03-31', 'precipitacion_mm'] = 0.0
+    escribir_particiones(df, raiz)
+
+    particion = cargar_manifiesto(raiz)['ciudades']['Temuco']['particiones']['2023']
+    assert particion['filas'] == 31
+    assert particion['meses'] == {'03': 21}
+    assert meses_incompletos(cargar_manifiesto(raiz), 'Temuco', [(2023, 3)]) == [(2023, 3)]
+
+    escribir_particiones(dias('Temuco', '2023-03-21', '2023-03-30'), raiz)
+    assert meses_incompletos(cargar_manifiesto(raiz), 'Temuco', [(2023, 3)]) == []
+
+
+def test_cada_escritura_sube_la_version_y_actualiza_checksums(raiz):
+    escribir_particiones(dias('Arica', '2024-01-01', '2024-01-31'), raiz)
+    primero = cargar_manifiesto(raiz)
+    escribir_particiones(dias('Arica', '2024-01-15', '2024-01-15', valor=35.0), raiz)
+    segundo = cargar_manifiesto(raiz)
+
+    assert segundo['version'] == primero['version'] + 1
+    antes, despues = primero['ciudades']['Arica'], segundo['ciudades']['Arica']
+    assert despues['particiones']['2024']['crc32'] != antes['particiones']['2024']['crc32']
+    assert despues['checksum'] != antes['checksum']
+    # El dato nuevo reemplaza al de la misma fecha sin duplicar filas
+    assert despues['filas'] == antes['filas'] == 31
+    datos = almacen_clima.leer_datos(['Arica'], '2024-01-15', '2024-01-15', raiz=raiz)
+    assert datos['temp_max_c'].tolist() == [35.0]
+
+
+def test_particiones_cambiadas(raiz):
+    escribir_particiones(pd.concat([
+        dias('Santiago', '2023-12-01', '2024-01-31'),
+        dias('Arica', '2024-01-01', '2024-01-31'),
+    ]), raiz)
+    anterior = cargar_manifiesto(raiz)
+    assert particiones_cambiadas(anterior, anterior) == {}
+
+    escribir_particiones(pd.concat([
+        dias('Santiago', '2024-02-01', '2024-02-29'),
+        dias('Temuco', '2022-06-01', '2022-06-30'),
+    ]), raiz)
+    nuevo = cargar_manifiesto(raiz)
+    # Santiago cambia desde 2024 (2023 quedo igual), Arica no cambia y Temuco es nueva
+    assert particiones_cambiadas(anterior, nuevo) == {'Santiago': 2024, 'Temuco': 2022}
+    assert particiones_cambiadas(nuevo, anterior) == {'Santiago': 2024, 'Temuco': 2022}
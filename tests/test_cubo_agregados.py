@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cubo_agregados import construir_cubo, estadisticos, medias_por, seleccionar
+
+METRICAS = ['temp_max_c', 'precipitacion_mm']
+CIUDADES = ['Arica', 'Coyhaique', 'Punta Arenas', 'Santiago', 'Talca', 'Temuco']
+
+
+@pytest.fixture(scope='module')
+def datos():
+    # Tres años diarios por ciudad, en float32 como en el dashboard, con NaN
+    # sueltos y un mes completo sin datos en una ciudad
+    rng = np.random.default_rng(5)
+    fechas = pd.date_range('2021-01-01', '2023-12-31', freq='D')
+    df = pd.concat([pd.DataFrame({'ciudad': c, 'fecha': fechas}) for c in CIUDADES], ignore_index=True)
+    df['ciudad'] = df['ciudad'].astype('category')
+    for m in METRICAS:
+        valores = rng.normal(15, 8, len(df)).astype('float32')
+        valores[rng.random(len(df)) < 0.05] = np.nan
+        df[m] = valores
+    vacio = (df['ciudad'] == 'Talca') & (df['fecha'].dt.to_period('M') == '2022-07')
+    df.loc[vacio, 'temp_max_c'] = np.nan
+    df['mes'] = df['fecha'].dt.month.astype('int8')
+    df['año'] = df['fecha'].dt.year.astype('int16')
+    return df, construir_cubo(df, METRICAS)
+
+
+def selecciones_aleatorias(n=25):
+    rng = np.random.default_rng(11)
+    for _ in range(n):
+        ciudades = sorted(rng.choice(CIUDADES, size=rng.integers(1, len(CIUDADES) + 1), replace=False))
+        inicio = rng.integers(0, 36)
+        fin = rng.integers(inicio, 36)
+        yield ciudades, (2021 + inicio // 12, 1 + inicio % 12), (2021 + fin // 12, 1 + fin % 12)
+
+
+def filas(df, ciudades, desde, hasta):
+    clave = df['año'].astype(int) * 12 + df['mes'].astype(int)
+    return df[df['ciudad'].isin(ciudades) & clave.between(desde[0] * 12 + desde[1], hasta[0] * 12 + hasta[1])]
+
+
+@pytest.mark.parametrize('metrica', METRICAS)
+def test_estadisticos_igual_a_pandas(datos, metrica):
+    df, cubo = datos
+    for ciudades, desde, hasta in selecciones_aleatorias():
+        esperado = filas(df, ciudades, desde, hasta)[metrica].astype('float64')
+        resumen = estadisticos(seleccionar(cubo, ciudades, desde, hasta), metrica)
+        assert resumen['n'] == esperado.count()
+        assert resumen['media'] == pytest.approx(esperado.mean(), rel=1e-9)
+        assert resumen['min'] == esperado.min()
+        assert resumen['max'] == esperado.max()
+        assert resumen['desviacion'] == pytest.approx(esperado.std(), rel=1e-6)
+
+
+@pytest.mark.parametrize('metrica', METRICAS)
+@pytest.mark.parametrize('por', ['mes', 'ciudad'])
+def test_medias_por_igual_a_groupby(datos, metrica, por):
+    df, cubo = datos
+    for ciudades, desde, hasta in selecciones_aleatorias():
+        sub = filas(df, ciudades, desde, hasta)
+        esperado = sub[metrica].astype('float64').groupby(sub[por], observed=True).mean().dropna()
+        obtenido = medias_por(seleccionar(cubo, ciudades, desde, hasta), metrica, por)
+        assert list(obtenido.index) == list(esperado.index)
+        np.testing.assert_allclose(obtenido.to_numpy(), esperado.to_numpy(), rtol=1e-9)
+
+
+def test_mes_sin_datos_no_aparece(datos):
+    df, cubo = datos
+    medias = medias_por(seleccionar(cubo, ['Talca'], (2022, 7), (2022, 7)), 'temp_max_c', 'mes')
+    assert medias.empty
+    assert estadisticos(seleccionar(cubo, ['Talca'], (2022, 7), (2022, 7)), 'temp_max_c')['n'] == 0
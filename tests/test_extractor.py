@@ -0,0 +1,49 @@
+import copy
+import json
+import os
+
+import pytest
+
+from extractor_clima_script import normalizar_respuesta, separar_respuesta
+
+RUTA_FIXTURE = os.path.join(os.path.dirname(__file__), 'datos', 'archivo_dos_ubicaciones.json')
+
+
+@pytest.fixture
+def respuesta():
+    # Respuesta del archivo de Open-Meteo a una peticion con dos coordenadas
+    with open(RUTA_FIXTURE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_lista_se_reparte_en_el_orden_pedido(respuesta):
+    frames = separar_respuesta(respuesta, ['Santiago', 'Valparaiso'])
+    assert list(frames) == ['Santiago', 'Valparaiso']
+    assert frames['Santiago']['temperature_2m_max'].tolist() == [29.9, 30.7, 30.3]
+    assert frames['Valparaiso']['temperature_2m_max'].tolist() == [20.6, 21.4, 20.6]
+    assert (frames['Valparaiso']['ciudad'] == 'Valparaiso').all()
+
+    df = normalizar_respuesta(frames['Santiago'], '2024-01-01', '2024-01-03')
+    assert list(df.columns) == ['ciudad', 'fecha', 'temp_max_c', 'temp_min_c', 'precipitacion_mm', 'viento_max_kmh']
+    assert df['fecha'].dt.strftime('%Y-%m-%d').tolist() == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert df['viento_max_kmh'].tolist() == [18.5, 17.5, 17.0]
+
+
+def test_objeto_unico(respuesta):
+    frames = separar_respuesta(respuesta[1], ['Valparaiso'])
+    assert list(frames) == ['Valparaiso']
+    assert frames['Valparaiso']['temperature_2m_min'].tolist() == [13.6, 14.7, 14.1]
+
+
+def test_cantidad_de_ubicaciones_distinta(respuesta):
+    with pytest.raises(ValueError, match='Se esperaban 3 ubicaciones y llegaron 2'):
+        separar_respuesta(respuesta, ['Santiago', 'Valparaiso', 'Rancagua'])
+    with pytest.raises(ValueError):
+        separar_respuesta(respuesta[0], ['Santiago', 'Valparaiso'])
+
+
+def test_ubicacion_sin_daily(respuesta):
+    respuesta = copy.deepcopy(respuesta)
+    del respuesta[0]['daily']
+    frames = separar_respuesta(respuesta, ['Santiago', 'Valparaiso'])
+    assert list(frames) == ['Valparaiso']
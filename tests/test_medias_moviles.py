@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indice_clima import IndiceClima
+from medias_moviles import inicios_ventana, media_movil_agrupada
+
+
+@pytest.fixture
+def indice():
+    # Dos ciudades; la primera sin datos en todo 2018 y con NaN sueltos
+    rng = np.random.default_rng(2)
+    fechas = pd.date_range('2016-01-01', '2019-12-31', freq='D')
+    a = pd.DataFrame({'ciudad': 'A', 'fecha': fechas, 'valor': rng.normal(20, 5, len(fechas))})
+    a = a[a['fecha'].dt.year != 2018]
+    a.loc[a.sample(frac=0.03, random_state=1).index, 'valor'] = np.nan
+    b = pd.DataFrame({'ciudad': 'B', 'fecha': fechas, 'valor': rng.normal(10, 3, len(fechas))})
+    df = pd.concat([b, a], ignore_index=True)
+    df['ciudad'] = df['ciudad'].astype('category')
+    return IndiceClima(df)
+
+
+@pytest.mark.parametrize('dias', [1, 7, 30, 365])
+def test_igual_a_rolling_por_tiempo(indice, dias):
+    df = indice.df
+    izquierda = inicios_ventana(df['fecha'].to_numpy(), indice.tramos.values(), dias)
+    obtenido = media_movil_agrupada(df['valor'].to_numpy(), izquierda)
+    esperado = (df.set_index('fecha').groupby('ciudad', observed=True)['valor']
+                .rolling(f'{dias}D', min_periods=1).mean().to_numpy())
+    np.testing.assert_allclose(obtenido, esperado, rtol=1e-9, equal_nan=True)
+
+
+def test_la_ventana_no_cruza_huecos(indice):
+    # Tras un año sin datos, la media de 365 días parte de cero
+    df = indice.df
+    izquierda = inicios_ventana(df['fecha'].to_numpy(), indice.tramos.values(), 365)
+    fila = df.index[(df['ciudad'] == 'A') & (df['fecha'] == '2019-01-01')][0]
+    assert izquierda[fila] == fila
+    assert media_movil_agrupada(df['valor'].to_numpy(), izquierda)[fila] == pytest.approx(df['valor'][fila])
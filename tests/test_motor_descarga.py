@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from motor_descarga import ErrorReintentable, MotorDescarga, Trabajo
+
+
+class ApiStub(BaseHTTPRequestHandler):
+    # El parametro 'caso' elige la respuesta; cada peticion queda registrada
+    # con su hora para medir las esperas entre intentos
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        servidor = self.server
+        q = parse_qs(urlparse(self.path).query)
+        caso, id_trabajo = q['caso'][0], q.get('id', ['0'])[0]
+        with servidor.lock:
+            servidor.peticiones.append((caso, id_trabajo, time.monotonic()))
+            intento = sum(1 for c, i, _ in servidor.peticiones if (c, i) == (caso, id_trabajo))
+            servidor.en_vuelo += 1
+            servidor.max_en_vuelo = max(servidor.max_en_vuelo, servidor.en_vuelo)
+        try:
+            if caso == '429' and intento == 1:
+                self._responder(429, b'', {'Retry-After': '0.3'})
+            elif caso == '503':
+                self._responder(503, b'')
+            elif caso == '404':
+                self._responder(404, b'{"error": true}')
+            elif caso == 'json_invalido':
+                self._responder(200, b'<html>no es json</html>')
+            else:
+                if caso == 'lento':
+                    time.sleep(0.05)
+                self._responder(200, json.dumps({'caso': caso, 'id': id_trabajo}).encode())
+        finally:
+            with servidor.lock:
+                servidor.en_vuelo -= 1
+
+    def _responder(self, codigo, cuerpo, cabeceras=None):
+        self.send_response(codigo)
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+@pytest.fixture
+def servidor():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), ApiStub)
+    srv.lock = threading.Lock()
+    srv.peticiones, srv.en_vuelo, srv.max_en_vuelo = [], 0, 0
+    srv.url = f'http://127.0.0.1:{srv.server_port}/v1/archive'
+    hilo = threading.Thread(target=srv.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    hilo.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def motor(servidor, **kwargs):
+    # Backoff casi nulo: las esperas que se miden vienen de Retry-After
+    opciones = dict(max_hilos=4, tasa=1000, max_reintentos=2, backoff_base=0.001, timeout=5)
+    opciones.update(kwargs)
+    return MotorDescarga(servidor.url, **opciones)
+
+
+def trabajo(caso, id_trabajo=0):
+    return Trabajo((caso, id_trabajo), {'caso': caso, 'id': id_trabajo})
+
+
+def test_429_respeta_retry_after(servidor):
+    with motor(servidor) as m:
+        [resultado] = list(m.ejecutar([trabajo('429')]))
+    assert resultado.error is None
+    assert resultado.datos == {'caso': '429', 'id': '0'}
+    assert resultado.intentos == 2
+    (_, _, primera), (_, _, segunda) = servidor.peticiones
+    assert segunda - primera >= 0.3
+    assert m.estadisticas['reintentos'] == 1
+
+
+def test_503_se_rinde_despues_de_max_reintentos(servidor):
+    with motor(servidor, max_reintentos=3) as m:
+        [resultado] = list(m.ejecutar([trabajo('503')]))
+    assert isinstance(resultado.error, ErrorReintentable)
+    assert str(resultado.error) == 'HTTP 503'
+    assert resultado.intentos == 4
+    assert len(servidor.peticiones) == 4
+    assert m.estadisticas['fallidos'] == 1
+    assert m.estadisticas['reintentos'] == 3
+
+
+def test_404_no_se_reintenta(servidor):
+    with motor(servidor) as m:
+        [resultado] = list(m.ejecutar([trabajo('404')]))
+    assert isinstance(resultado.error, requests.exceptions.HTTPError)
+    assert resultado.intentos == 1
+    assert len(servidor.peticiones) == 1
+    assert m.estadisticas['reintentos'] == 0
+
+
+def test_json_invalido_es_un_error_sin_reintento(servidor):
+    with motor(servidor) as m:
+        [resultado] = list(m.ejecutar([trabajo('json_invalido')]))
+    assert resultado.datos is None
+    assert isinstance(resultado.error, ValueError)
+    assert resultado.intentos == 1
+    assert len(servidor.peticiones) == 1
+
+
+def test_max_pendientes_limita_lo_que_esta_en_vuelo(servidor):
+    tomados = []
+
+    def trabajos():
+        for i in range(12):
+            tomados.append(i)
+            yield trabajo('lento', i)
+
+    with motor(servidor, max_hilos=4, max_pendientes=2) as m:
+        resultados = m.ejecutar(trabajos())
+        next(resultados)
+        # El consumidor no pidio mas: solo se tomaron los que caben en vuelo
+        assert len(tomados) <= 3
+        resto = list(resultados)
+    assert len(resto) == 11
+    assert servidor.max_en_vuelo <= 2
+    assert m.estadisticas['completados'] == 12
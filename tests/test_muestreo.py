@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import muestreo
+from muestreo import _cubetas, indices_lttb, indices_minmax, reducir
+
+
+@pytest.fixture
+def serie():
+    rng = np.random.default_rng(3)
+    n = 10000
+    x = pd.date_range('2000-01-01', periods=n, freq='D').to_numpy()
+    # Estacionalidad, ruido y algunos picos aislados que no deben perderse
+    y = 10 * np.sin(np.arange(n) / 58) + rng.normal(0, 2, n)
+    y[[17, 4321, 9876]] = [60.0, -45.0, 55.0]
+    return x, y
+
+
+def test_minmax_conserva_extremos_globales_y_por_cubeta(serie):
+    _, y = serie
+    n_puntos = 200
+    idx = indices_minmax(y, n_puntos)
+    assert len(idx) <= n_puntos
+    assert np.all(np.diff(idx) > 0)
+    assert {0, len(y) - 1, int(np.argmax(y)), int(np.argmin(y))} <= set(idx.tolist())
+    bordes = _cubetas(len(y), (n_puntos - 2) // 2)
+    for a, b in zip(bordes[:-1], bordes[1:]):
+        en_cubeta = idx[(idx >= a) & (idx < b)]
+        assert y[en_cubeta].max() == y[a:b].max()
+        assert y[en_cubeta].min() == y[a:b].min()
+
+
+def test_lttb_conserva_extremos_de_la_serie(serie):
+    x, y = serie
+    n_puntos = 300
+    idx = indices_lttb(x.view('i8').astype('float64'), y, n_puntos)
+    assert len(idx) == n_puntos
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert np.all(np.diff(idx) > 0)
+
+
+@pytest.mark.parametrize('algoritmo', ['minmax', 'lttb'])
+def test_reducir_respeta_presupuesto(serie, algoritmo):
+    x, y = serie
+    idx = reducir(x, y, 500, algoritmo)
+    assert len(idx) <= 500
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+
+
+def test_series_cortas_y_ninguno_devuelven_todo(serie):
+    x, y = serie
+    np.testing.assert_array_equal(reducir(x[:100], y[:100], 500), np.arange(100))
+    np.testing.assert_array_equal(reducir(x, y, 500, 'ninguno'), np.arange(len(y)))
+
+
+@pytest.mark.parametrize('algoritmo', muestreo.ALGORITMOS)
+def test_huecos_de_nan_se_conservan(serie, algoritmo):
+    x, y = serie
+    y = y.copy()
+    y[2000:2100] = np.nan
+    y[7000] = np.nan
+    idx = reducir(x, y, 400, algoritmo)
+    for a, b in ((2000, 2100), (7000, 7001)):
+        # Al menos un NaN del hueco queda, y la linea no lo cruza
+        assert np.any((idx >= a) & (idx < b))
+    assert np.isnan(y[idx]).sum() <= (len(y) if algoritmo == 'ninguno' else 2)
+
+
+def test_algoritmo_desconocido():
+    with pytest.raises(ValueError):
+        reducir([0, 1], [0.0, 1.0], 10, 'promedio')
@@ -0,0 +1,53 @@
+import planificador_trabajos
+from motor_descarga import Trabajo
+from planificador_trabajos import ColaTrabajos, fragmento_de
+
+CIUDADES = ['Antofagasta', 'Santiago', 'Temuco', 'Punta Arenas', 'Arica', 'Coyhaique']
+
+
+def plan(ciudades, desde, hasta, n_fragmentos):
+    trabajos = [Trabajo(((c,), desde, hasta), {'c': c}) for c in ciudades]
+    return trabajos, [fragmento_de(c, n_fragmentos) for c in ciudades]
+
+
+def reclamados(cola, n_fragmentos):
+    return {f: [t.clave for t in cola.reclamar(f)] for f in range(n_fragmentos)}
+
+
+def test_corrida_interrumpida_no_se_reparte_con_otro_numero_de_procesos(tmp_path):
+    ruta = str(tmp_path / 'trabajos.sqlite')
+    with ColaTrabajos(ruta) as cola:
+        # Corrida con 3 procesos que se corta: un trabajo en curso, otro hecho
+        # y el resto sin empezar
+        cola.registrar(*plan(CIUDADES, '2026-01-01', '2026-03-31', 3))
+        en_curso = next(cola.reclamar(fragmento_de('Antofagasta', 3)))
+        hecho = next(cola.reclamar(fragmento_de('Santiago', 3)))
+        cola.marcar_hechos([(hecho.clave, 90)])
+
+        # La corrida siguiente, con 2 procesos, planifica otros rangos
+        cola.registrar(*plan(CIUDADES, '2026-01-01', '2026-04-30', 2))
+        por_fragmento = reclamados(cola, 3)
+
+        claves = [clave for claves in por_fragmento.values() for clave in claves]
+        assert sorted(claves) == sorted(((c,), '2026-01-01', '2026-04-30') for c in CIUDADES)
+        assert en_curso.clave not in claves
+        assert por_fragmento[2] == []
+        for fragmento, claves_fragmento in por_fragmento.items():
+            assert all(fragmento_de(ciudades[0], 2) == fragmento for ciudades, _, _ in claves_fragmento)
+
+        estados = cola.estados()
+    assert estados['obsoleto'] == len(CIUDADES) - 1
+    assert estados['hecho'] == 1
+    assert estados['en_curso'] == len(CIUDADES)
+    assert set(estados) == set(planificador_trabajos.ESTADOS)
+
+
+def test_misma_clave_vuelve_a_pendiente(tmp_path):
+    with ColaTrabajos(str(tmp_path / 'trabajos.sqlite')) as cola:
+        trabajos, fragmentos = plan(['Arica'], '2026-01-01', '2026-01-31', 1)
+        cola.registrar(trabajos, fragmentos)
+        trabajo = next(cola.reclamar(0))
+        cola.marcar_fallido(trabajo.clave, 'sin datos')
+
+        cola.registrar(trabajos, fragmentos)
+        assert [t.clave for t in cola.reclamar(0)] == [trabajo.clave]
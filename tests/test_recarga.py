@@ -0,0 +1,126 @@
+import importlib
+import random
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import almacen_clima
+
+RAIZ_REPO = Path(__file__).resolve().parent.parent
+CIUDADES = ['Arica', 'Punta Arenas', 'Santiago', 'Temuco']
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Almacen chico (4 ciudades, 2024-2025) en un directorio temporal y el
+    # dashboard cargado de inmediato, sin vigia ni snapshot
+    (tmp_path / 'data').mkdir()
+    shutil.copy(RAIZ_REPO / 'data' / 'ubicaciones.csv', tmp_path / 'data' / 'ubicaciones.csv')
+    df = pd.read_csv(RAIZ_REPO / almacen_clima.RUTA_CSV)
+    df = df[df['ciudad'].isin(CIUDADES) & (df['fecha'] >= '2024-01-01')]
+    almacen_clima.escribir_particiones(df, str(tmp_path / almacen_clima.RUTA_ALMACEN))
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('CLIMA_MODO_CARGA', 'inmediata')
+    monkeypatch.setenv('CLIMA_INTERVALO_RECARGA', '0')
+    monkeypatch.setenv('CLIMA_SNAPSHOT', '0')
+    monkeypatch.delenv('CLIMA_UBICACIONES', raising=False)
+    sys.modules.pop('ubicaciones', None)
+    sys.modules.pop('app', None)
+    modulo = importlib.import_module('app')
+    yield modulo
+    sys.modules.pop('app', None)
+    sys.modules.pop('ubicaciones', None)
+
+
+def renderizar_todo(app, filtro, metrica):
+    app.renderizar_kpis(filtro, metrica)
+    app.renderizar_mapa(filtro, metrica)
+    app.renderizar_anomalias(filtro, metrica)
+    app.renderizar_distribucion(filtro, metrica)
+    app.renderizar_serie(filtro, metrica, ['ma7'], None)
+
+
+def test_mes_nuevo_con_carga(app):
+    anteriores = app.datos
+    assert anteriores.fecha_max == pd.Timestamp('2025-12-31')
+    columnas_viejas = [anteriores.df[c].to_numpy() for c in almacen_clima.COLUMNAS_METRICAS]
+
+    # Filtros en cache antes del cambio. El de 2024 no toca el mes nuevo y,
+    # con una sola ciudad, es una vista del df anterior. El que pide hasta
+    # enero de 2026 todavía no tiene esas filas.
+    filtro_2024 = app.actualizar_store(1, ['Santiago'], 2024, 1, 2024, 12)
+    filtro_enero = app.actualizar_store(1, ['Arica', 'Temuco'], 2025, 6, 2026, 1)
+    assert app.obtener_filtrado(anteriores, filtro_enero)['fecha'].max() == pd.Timestamp('2025-12-31')
+
+    errores, peticiones = [], []
+    parar = threading.Event()
+
+    def trabajador(semilla):
+        rnd = random.Random(semilla)
+        while not parar.is_set():
+            ciudades = sorted(rnd.sample(CIUDADES, rnd.randint(1, 3)))
+            metrica = rnd.choice(list(app.metricas_disponibles))
+            version = app.datos.version
+            try:
+                filtro = app.actualizar_store(1, ciudades, 2024, rnd.randint(1, 12), 2025, 12)
+                renderizar_todo(app, filtro, metrica)
+                peticiones.append(version)
+            except Exception as e:
+                errores.append(repr(e))
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    def esperar_peticiones(version, n=8, limite=30):
+        fin = time.monotonic() + limite
+        while peticiones.count(version) < n and not errores and time.monotonic() < fin:
+            time.sleep(0.05)
+
+    try:
+        esperar_peticiones(anteriores.version)
+        # Un mes sintético para todas las ciudades, escrito mientras llegan peticiones
+        fechas = pd.date_range('2026-01-01', '2026-01-31', freq='D')
+        nuevo = pd.DataFrame({'ciudad': np.repeat(CIUDADES, len(fechas)), 'fecha': np.tile(fechas, len(CIUDADES))})
+        for columna in almacen_clima.COLUMNAS_METRICAS:
+            nuevo[columna] = 99.0
+        almacen_clima.escribir_particiones(nuevo)
+        app.recargar_datos()
+        esperar_peticiones(app.datos.version)
+    finally:
+        parar.set()
+        for hilo in hilos:
+            hilo.join()
+
+    assert errores == []
+    assert peticiones.count(anteriores.version) >= 8 and peticiones.count(app.datos.version) >= 8
+
+    datos = app.datos
+    assert datos.version != anteriores.version
+    assert datos.fecha_max == pd.Timestamp('2026-01-31')
+    assert 2026 in datos.available_years
+    solo_enero = app.actualizar_store(1, ['Santiago'], 2026, 1, 2026, 1)
+    assert (app.obtener_filtrado(datos, solo_enero)['temp_max_c'] == 99.0).all()
+
+    # El filtro de 2024 sobrevive, con las filas de los datos nuevos y sin
+    # compartir memoria con el df anterior (que así puede liberarse)
+    clave = app.clave_filtro(filtro_2024)
+    assert clave in app.cache_filtrados._datos
+    guardado = app.cache_filtrados._datos[clave][0]
+    pd.testing.assert_frame_equal(guardado, app.filtrar_dataframe(datos, *clave))
+    for columna, vieja in zip(almacen_clima.COLUMNAS_METRICAS, columnas_viejas):
+        assert not np.shares_memory(guardado[columna].to_numpy(), vieja)
+    for valor, _ in app.cache_filtrados._datos.values():
+        for vieja in columnas_viejas:
+            assert not any(np.shares_memory(valor[c].to_numpy(), vieja) for c in almacen_clima.COLUMNAS_METRICAS)
+
+    # El que llega a enero de 2026 se descartó: al pedirlo de nuevo trae el mes nuevo
+    assert app.clave_filtro(filtro_enero) not in app.cache_filtrados._datos
+    renderizar_todo(app, filtro_enero, 'temp_max_c')
+    assert app.obtener_filtrado(datos, filtro_enero)['fecha'].max() == pd.Timestamp('2026-01-31')
@@ -0,0 +1,34 @@
+# ubicaciones.py - registro de ubicaciones compartido por el extractor y el dashboard
+
+import os
+
+import pandas as pd
+
+RUTA_UBICACIONES = os.environ.get('CLIMA_UBICACIONES', os.path.join('data', 'ubicaciones.csv'))
+COLUMNAS = ['id', 'nombre', 'lat', 'lon', 'region']
+
+
+def cargar_ubicaciones(ruta=RUTA_UBICACIONES):
+    # El nombre es la clave de los datos (columna ciudad y particiones del
+    # almacen), asi que tanto id como nombre deben ser unicos
+    df = pd.read_csv(ruta, dtype={'id': str, 'nombre': str, 'region': str})
+    faltantes = set(COLUMNAS) - set(df.columns)
+    if faltantes:
+        raise ValueError(f"Faltan columnas en {ruta}: {', '.join(sorted(faltantes))}")
+    df = df[COLUMNAS].copy()
+    df['nombre'] = df['nombre'].str.strip()
+    for columna in ('id', 'nombre'):
+        repetidos = df.loc[df[columna].duplicated(), columna].tolist()
+        if repetidos:
+            raise ValueError(f"Valores repetidos de '{columna}' en {ruta}: {', '.join(repetidos[:5])}")
+    fuera = ~(df['lat'].between(-90, 90) & df['lon'].between(-180, 180))
+    if fuera.any():
+        raise ValueError(f"Coordenadas invalidas en {ruta}: {', '.join(df.loc[fuera, 'nombre'].tolist()[:5])}")
+    return df
+
+
+def coordenadas(df=None):
+    # {nombre: (lat, lon)} en el orden del registro
+    if df is None:
+        df = cargar_ubicaciones()
+    return {nombre: (lat, lon) for nombre, lat, lon in zip(df['nombre'], df['lat'], df['lon'])}